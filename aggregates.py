@@ -0,0 +1,152 @@
+import threading
+
+
+# Поля сводки: записей, минут услуг, минут перерывов, выручка, отмен, завершенных записей
+FIELDS = ("appointments", "booked_minutes", "break_minutes", "revenue", "cancellations", "completed")
+FIELD_COUNT = len(FIELDS)
+ZERO = (0,) * FIELD_COUNT
+
+
+def contribution(appointment, status):
+    """Вклад записи в сводку при данном статусе"""
+    if status is None:
+        return ZERO
+    if status == "cancelled":
+        return 0, 0, 0, 0, 1, 0
+    return (1, appointment.service.duration, appointment.master.break_duration, appointment.service.price, 0,
+            1 if status == "completed" else 0)
+
+
+class DaySeries:
+    """Поля сводки по дням с префиксными суммами (дерево Фенвика) для выборки по диапазону дат"""
+
+    __slots__ = ("values", "origin", "size", "tree")
+
+    def __init__(self):
+        self.values = {}  # {номер дня: [поля]}
+        self.origin = None  # номер дня в позиции 1 дерева
+        self.size = 0
+        # Узел i дерева (i от 1) - суммы полей по отрезку дней, лежат в tree[i * FIELD_COUNT:(i + 1) * FIELD_COUNT]
+        self.tree = []
+
+    def add(self, day, deltas):
+        row = self.values.get(day)
+        if row is None:
+            row = self.values[day] = [0] * FIELD_COUNT
+        for field, delta in enumerate(deltas):
+            row[field] += delta
+
+        if self.origin is None or not 0 < day - self.origin + 1 <= self.size:
+            self._rebuild()
+            return
+        tree, index = self.tree, day - self.origin + 1
+        while index <= self.size:
+            offset = index * FIELD_COUNT
+            for field, delta in enumerate(deltas):
+                tree[offset + field] += delta
+            index += index & -index
+
+    def _rebuild(self):
+        # Дерево строится заново с запасом в год в обе стороны, чтобы новые дни редко требовали перестройки
+        first, last = min(self.values), max(self.values)
+        self.origin = first - 366 if self.origin is None else min(self.origin, first - 366)
+        size = 1
+        while size < last - self.origin + 367:
+            size *= 2
+        tree = [0] * ((size + 1) * FIELD_COUNT)
+        for day, row in self.values.items():
+            offset = (day - self.origin + 1) * FIELD_COUNT
+            for field, value in enumerate(row):
+                tree[offset + field] += value
+        # Построение за линейное время: каждый узел добавляет свою сумму родителю
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                offset, parent_offset = index * FIELD_COUNT, parent * FIELD_COUNT
+                for field in range(FIELD_COUNT):
+                    tree[parent_offset + field] += tree[offset + field]
+        self.size, self.tree = size, tree
+
+    def prefix(self, day):
+        """Суммы полей за все дни до day включительно"""
+        totals = [0] * FIELD_COUNT
+        if self.origin is None:
+            return totals
+        tree, index = self.tree, min(day - self.origin + 1, self.size)
+        while index > 0:
+            offset = index * FIELD_COUNT
+            for field in range(FIELD_COUNT):
+                totals[field] += tree[offset + field]
+            index -= index & -index
+        return totals
+
+    def range_sum(self, day_from=None, day_to=None):
+        """Суммы полей за дни [day_from, day_to], None - без границы; пустой диапазон дает нули"""
+        if day_from is not None and day_to is not None and day_from > day_to:
+            return [0] * FIELD_COUNT
+        high = self.prefix(day_to) if day_to is not None else self.prefix(self.size + (self.origin or 0))
+        if day_from is None:
+            return high
+        low = self.prefix(day_from - 1)
+        return [high_value - low_value for high_value, low_value in zip(high, low)]
+
+
+class SalonAggregates:
+    """Текущие сводки по салону, мастерам и категориям услуг: записи, минуты, выручка, отмены.
+
+    Обновляются по событиям салона (см. BeautySalon.subscribe): событие меняет сводку на разницу
+    вкладов нового и прежнего статуса записи, поэтому повторное событие ничего не портит.
+    Отмененные записи не дают выручки и минут, только счетчик отмен.
+    """
+
+    def __init__(self):
+        self.total = DaySeries()
+        self.by_master = {}  # {id мастера: DaySeries}
+        self.by_category = {}  # {категория услуги: DaySeries}
+        self.statuses = {}  # {id записи: статус, с которым запись учтена}
+        self._lock = threading.Lock()
+
+    def on_change(self, event, appointment):
+        """Подписчик событий салона"""
+        with self._lock:
+            old = self.statuses.get(appointment.appointment_id)
+            new = appointment.status
+            if old == new:
+                return
+            self.statuses[appointment.appointment_id] = new
+            deltas = [after - before for after, before in
+                      zip(contribution(appointment, new), contribution(appointment, old))]
+            day = appointment.day
+            self.total.add(day, deltas)
+            master_series = self.by_master.get(appointment.master.master_id)
+            if master_series is None:
+                master_series = self.by_master[appointment.master.master_id] = DaySeries()
+            master_series.add(day, deltas)
+            category_series = self.by_category.get(appointment.service.category)
+            if category_series is None:
+                category_series = self.by_category[appointment.service.category] = DaySeries()
+            category_series.add(day, deltas)
+
+    def totals(self, day_from=None, day_to=None):
+        with self._lock:
+            return dict(zip(FIELDS, self.total.range_sum(day_from, day_to)))
+
+    def per_master(self, day_from=None, day_to=None):
+        with self._lock:
+            return {master_id: dict(zip(FIELDS, series.range_sum(day_from, day_to)))
+                    for master_id, series in self.by_master.items()}
+
+    def per_category(self, day_from=None, day_to=None):
+        with self._lock:
+            return {category: dict(zip(FIELDS, series.range_sum(day_from, day_to)))
+                    for category, series in self.by_category.items()}
+
+    def per_day(self, day_from, day_to):
+        """[(номер дня, поля)] для дней с записями из [day_from, day_to]"""
+        with self._lock:
+            values = self.total.values
+            if day_to - day_from < len(values):
+                days = [day for day in range(day_from, day_to + 1) if day in values]
+            else:
+                days = sorted(day for day in values if day_from <= day <= day_to)
+            return [(day, dict(zip(FIELDS, values[day]))) for day in days]
@@ -0,0 +1,147 @@
+from bisect import bisect_left, bisect_right, insort
+import threading
+
+
+class DayBuckets:
+    """Записи, разложенные по дням; дни хранятся по возрастанию для выборки по диапазону дат"""
+
+    __slots__ = ("buckets", "days")
+
+    def __init__(self):
+        self.buckets = {}  # {номер дня: {id записи: Appointment}}
+        self.days = []  # номера дней, в которых есть записи, по возрастанию
+
+    def add(self, appointment):
+        bucket = self.buckets.get(appointment.day)
+        if bucket is None:
+            bucket = self.buckets[appointment.day] = {}
+            insort(self.days, appointment.day)
+        bucket[appointment.appointment_id] = appointment
+
+    def iter_range(self, day_from=None, day_to=None, reverse=False):
+        """Перебирает записи дней из [day_from, day_to] по дате и времени начала"""
+        low = 0 if day_from is None else bisect_left(self.days, day_from)
+        high = len(self.days) if day_to is None else bisect_right(self.days, day_to)
+        days = self.days[low:high]
+        if reverse:
+            days.reverse()
+        for day in days:
+            yield from sorted(self.buckets[day].values(), key=lambda a: (a.start, a.appointment_id), reverse=reverse)
+
+
+class AppointmentIndex:
+    """Вторичные индексы записей: по дате, мастеру и дате, клиенту и дате, статусу.
+
+    Обновляется по событиям салона (см. BeautySalon.subscribe), записи из индексов не удаляются:
+    отмененные остаются в истории и только переходят в другой статус.
+    """
+
+    def __init__(self):
+        self.by_day = DayBuckets()
+        self.by_master = {}  # {id мастера: DayBuckets}
+        self.by_client = {}  # {id клиента: DayBuckets}
+        self.by_status = {}  # {статус: отсортированные id записей}
+        self.ids = []  # id всех записей по возрастанию
+        self.appointments = {}  # {id записи: Appointment}
+        self._lock = threading.Lock()
+
+    def on_change(self, event, appointment):
+        """Подписчик событий салона"""
+        with self._lock:
+            if event == "created":
+                self._add(appointment)
+            else:
+                self._set_status(appointment)
+
+    def _add(self, appointment):
+        appointment_id = appointment.appointment_id
+        if appointment_id in self.appointments:
+            return
+        self.appointments[appointment_id] = appointment
+        self.by_day.add(appointment)
+        self.by_master.setdefault(appointment.master.master_id, DayBuckets()).add(appointment)
+        self.by_client.setdefault(appointment.client.client_id, DayBuckets()).add(appointment)
+        insort(self.ids, appointment_id)
+        insort(self.by_status.setdefault(appointment.status, []), appointment_id)
+
+    def _set_status(self, appointment):
+        appointment_id = appointment.appointment_id
+        for status, ids in self.by_status.items():
+            if status == appointment.status:
+                continue
+            index = bisect_left(ids, appointment_id)
+            if index < len(ids) and ids[index] == appointment_id:
+                del ids[index]
+        ids = self.by_status.setdefault(appointment.status, [])
+        index = bisect_left(ids, appointment_id)
+        if index == len(ids) or ids[index] != appointment_id:
+            ids.insert(index, appointment_id)
+
+    def iter_query(self, master_id=None, client_id=None, status=None, day_from=None, day_to=None):
+        """Лениво перебирает подходящие записи по дате и времени начала.
+
+        Записи выбираются по одному дню, блокировка держится только на время выборки дня,
+        поэтому обход всей истории не собирает ее в память и не мешает новым записям.
+        """
+        with self._lock:
+            if client_id is not None:
+                buckets = self.by_client.get(client_id)
+            elif master_id is not None:
+                buckets = self.by_master.get(master_id)
+            else:
+                buckets = self.by_day
+            if buckets is None:
+                return
+            low = 0 if day_from is None else bisect_left(buckets.days, day_from)
+            high = len(buckets.days) if day_to is None else bisect_right(buckets.days, day_to)
+            days = buckets.days[low:high]
+        for day in days:
+            yield from self.query(master_id, client_id, status, day, day)
+
+    def query(self, master_id=None, client_id=None, status=None, day_from=None, day_to=None,
+              offset=0, limit=None, order_by="time", newest_first=False):
+        """Возвращает записи, подходящие под все заданные условия.
+
+        order_by="time" - по дате и времени начала, order_by="id" - по номеру записи;
+        newest_first разворачивает порядок. offset и limit задают страницу.
+        """
+        with self._lock:
+            dated = master_id is not None or client_id is not None or day_from is not None or day_to is not None
+            if order_by == "id" and not dated:
+                # Только статус: выборка из списка id без перебора дней
+                ids = self.ids if status is None else self.by_status.get(status, [])
+                if newest_first:
+                    end = len(ids) - offset
+                    start = 0 if limit is None else max(end - limit, 0)
+                    page = ids[start:max(end, 0)][::-1]
+                else:
+                    page = ids[offset:None if limit is None else offset + limit]
+                return [self.appointments[appointment_id] for appointment_id in page]
+
+            if client_id is not None:
+                buckets = self.by_client.get(client_id)
+            elif master_id is not None:
+                buckets = self.by_master.get(master_id)
+            else:
+                buckets = self.by_day
+            if buckets is None:
+                return []
+
+            matches = (
+                a for a in buckets.iter_range(day_from, day_to, reverse=newest_first and order_by == "time")
+                if (status is None or a.status == status)
+                and (master_id is None or a.master.master_id == master_id)
+            )
+            if order_by == "id":
+                matches = sorted(matches, key=lambda a: a.appointment_id, reverse=newest_first)
+                return matches[offset:None if limit is None else offset + limit]
+
+            page = []
+            for appointment in matches:
+                if offset:
+                    offset -= 1
+                    continue
+                if limit is not None and len(page) >= limit:
+                    break
+                page.append(appointment)
+            return page
@@ -0,0 +1,232 @@
+"""Нагрузочные замеры ядра расписания на синтетическом салоне.
+
+Запуск: python benchmark.py --size medium --output bench.json
+Сравнение с прошлым запуском: python benchmark.py --size medium --compare bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from statistics import median
+
+from salon import BeautySalon, date_to_ordinal, minutes_to_time, time_to_minutes, WORKDAY_START, WORKDAY_END
+
+
+# Размеры салона: (мастера, клиенты, записи, дней вперед)
+SIZES = {
+    "small": (20, 1000, 10000, 30),
+    "medium": (200, 20000, 200000, 90),
+    "large": (1000, 100000, 1000000, 365),
+}
+
+# Первый день записей: постоянная дата в будущем, чтобы при одном seed салон не менялся со временем
+FIRST_DAY = "2100-01-04"
+
+# Сколько вызовов каждой операции делается без замера перед первым кругом
+WARMUP_CALLS = 100
+
+SERVICE_CATALOG = [
+    ("Женская стрижка", 90, 2500, "hair"),
+    ("Мужская стрижка", 60, 1500, "hair"),
+    ("Окрашивание волос", 180, 5000, "hair"),
+    ("Укладка", 60, 2000, "hair"),
+    ("Маникюр", 90, 3500, "nails"),
+    ("Педикюр", 90, 3000, "nails"),
+    ("Чистка лица", 90, 4000, "cosmetology"),
+    ("Коррекция бровей", 30, 800, "cosmetology"),
+    ("Депиляция подмышек", 20, 1000, "depilation"),
+]
+
+
+def generate_salon(masters, clients, appointments, days, seed=1):
+    """Строит салон заданного размера; при одном seed получается один и тот же салон"""
+    rng = random.Random(seed)
+    salon = BeautySalon("Тестовый салон")
+    services = [salon.add_service(*service) for service in SERVICE_CATALOG]
+
+    for number in range(masters):
+        specialization = [service.name for service in rng.sample(services, rng.randint(1, 4))]
+        salon.add_master(f"Мастер {number}", specialization, f"+7916{number:07d}")
+    for number in range(clients):
+        salon.add_client(f"Клиент{number} Фамилия{number % 997}", f"+7903{number:07d}")
+
+    first_day = datetime.strptime(FIRST_DAY, "%Y-%m-%d").date()
+    dates = [(first_day + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
+    master_list = list(salon.masters.values())
+    requests = []
+    for _ in range(appointments):
+        master = rng.choice(master_list)
+        service = salon.services[rng.choice([service.service_id for service in services
+                                             if service.name in master.specialization])]
+        start = rng.randrange(WORKDAY_START, WORKDAY_END - service.duration + 1, 5)
+        requests.append((rng.randint(1, clients), master.master_id, service.service_id,
+                         rng.choice(dates), minutes_to_time(start)))
+    salon.create_appointments_batch(requests)
+    return salon, dates
+
+
+def measure(operations):
+    """Замеряет операции по кругам, возвращает статистику задержек по каждой.
+
+    operations - {название: (operation, вызовы по кругам, вызовы для разогрева, before_round или None)}.
+    Круги разных операций чередуются, поэтому медленный период машины задевает все операции
+    в одном круге, а не одну операцию целиком. Перцентили считаются по всем вызовам,
+    mean_us - медиана средних по кругам, best_us - лучшее среднее круга (по нему идет сравнение).
+    """
+    for operation, _, warmup, _ in operations.values():
+        for args in warmup:
+            operation(*args)
+
+    latencies = {name: [] for name in operations}
+    round_means = {name: [] for name in operations}
+    rounds = max(len(rounds_calls) for _, rounds_calls, _, _ in operations.values())
+    for number in range(rounds):
+        for name, (operation, rounds_calls, _, before_round) in operations.items():
+            if number >= len(rounds_calls):
+                continue
+            if before_round is not None:
+                before_round()
+            round_latencies = []
+            for args in rounds_calls[number]:
+                started = time.perf_counter()
+                operation(*args)
+                round_latencies.append(time.perf_counter() - started)
+            latencies[name] += round_latencies
+            round_means[name].append(sum(round_latencies) / len(round_latencies))
+
+    return {name: summarize(latencies[name], round_means[name]) for name in operations}
+
+
+def summarize(latencies, round_means):
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1e6, 2)
+
+    return {
+        "calls": len(latencies),
+        "rounds": len(round_means),
+        "total_s": round(sum(latencies), 4),
+        "mean_us": round(median(round_means) * 1e6, 2),
+        "best_us": round(min(round_means) * 1e6, 2),
+        "p50_us": percentile(0.5),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+    }
+
+
+def run_benchmarks(size, seed, probes, rounds=10):
+    masters, clients, appointments, days = SIZES[size]
+    rng = random.Random(seed + 1)
+
+    started = time.perf_counter()
+    salon, dates = generate_salon(masters, clients, appointments, days, seed)
+    build_seconds = time.perf_counter() - started
+    booked = len(salon.appointments)  # часть сгенерированных записей отклоняется как пересекающиеся
+
+    master_list = list(salon.masters.values())
+    service_ids = {service.name: service.service_id for service in salon.services.values()}
+
+    def random_booking():
+        master = rng.choice(master_list)
+        service = salon.services[service_ids[rng.choice(master.specialization)]]
+        start = rng.randrange(WORKDAY_START, WORKDAY_END - service.duration + 1, 5)
+        return master, service, rng.choice(dates), minutes_to_time(start)
+
+    def make_calls(count):
+        is_available_calls, slot_calls, create_calls = [], [], []
+        for _ in range(count):
+            master, service, date, time_slot = random_booking()
+            is_available_calls.append((date_to_ordinal(date), time_to_minutes(time_slot), service.duration, master))
+            slot_calls.append((master.master_id, date, service.duration))
+            create_calls.append((rng.randint(1, clients), master.master_id, service.service_id, date, time_slot))
+        return is_available_calls, slot_calls, create_calls
+
+    # Каждый круг получает свои вызовы: записи из прошлого круга уже заняли свое время
+    per_round = max(probes // rounds, 1)
+    warmup = make_calls(min(WARMUP_CALLS, per_round))
+    calls = [make_calls(per_round) for _ in range(rounds)]
+
+    def rounds_of(kind):
+        return [round_calls[kind] for round_calls in calls]
+
+    cancel_ids = rng.sample(list(salon.appointments), min(per_round * rounds, len(salon.appointments)))
+    cancel_calls = [[(appointment_id,) for appointment_id in cancel_ids[start:start + per_round]]
+                    for start in range(0, len(cancel_ids), per_round)]
+
+    results = measure({
+        "is_available": (lambda day, start, duration, master: master.is_available(day, start, duration),
+                         rounds_of(0), warmup[0], None),
+        # Кэш очищается перед кругом, иначе повторные круги мерили бы только попадания
+        "get_available_time_slots": (salon.get_available_time_slots, rounds_of(1), warmup[1],
+                                     salon.slot_cache.clear),
+        "create_appointment": (salon.create_appointment, rounds_of(2), warmup[2], None),
+        "cancel_appointment": (salon.cancel_appointment, cancel_calls, (), None),
+    })
+
+    return {
+        "size": size,
+        "seed": seed,
+        "first_day": FIRST_DAY,
+        "masters": masters,
+        "clients": clients,
+        "appointments_requested": appointments,
+        "appointments_booked": booked,
+        "days": days,
+        "build_s": round(build_seconds, 3),
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+
+def compare(current, previous, threshold):
+    """Печатает изменение лучших средних по кругам; возвращает True, если есть замедление больше threshold.
+
+    Лучший круг меньше всего зависит от помех на машине; у отчетов без best_us берется mean_us.
+    """
+    regressed = False
+    for name, stats in current["results"].items():
+        old = previous["results"].get(name)
+        if not old:
+            continue
+        old_us, new_us = old.get("best_us", old["mean_us"]), stats["best_us"]
+        ratio = new_us / old_us if old_us else float("inf")
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  <-- замедление"
+            regressed = True
+        print(f"{name:28} {old_us:>10.2f} -> {new_us:>10.2f} мкс ({ratio:.2f}x){marker}", file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры скорости ядра расписания салона")
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--probes", type=int, default=2000, help="сколько вызовов каждой операции замерять")
+    parser.add_argument("--rounds", type=int, default=10, help="на сколько кругов делить замеры")
+    parser.add_argument("--output", help="файл для результатов в JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.5, help="допустимое замедление при сравнении (0.5 = 50%%)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.size, args.seed, args.probes, args.rounds)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare(report, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
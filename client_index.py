@@ -0,0 +1,81 @@
+from bisect import bisect_left
+import threading
+
+
+def normalize_phone(phone):
+    """Оставляет в телефоне только цифры, российский номер с 8 приводит к виду 7XXXXXXXXXX"""
+    digits = ''.join(ch for ch in phone if ch.isdigit())
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return digits
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class ClientIndex:
+    """Индексы клиентов: по нормализованному телефону, по email и по началу слов имени"""
+
+    def __init__(self, clients):
+        self.clients = clients  # {id клиента: Client} салона, из него берутся результаты поиска по имени
+        self.by_phone = {}  # {нормализованный телефон: Client}
+        self.by_email = {}  # {email: [Client]}
+        self.name_words = []  # отсортированные (слово имени в нижнем регистре, id клиента)
+        self.pending_words = []  # добавленные после последнего поиска, еще не отсортированы
+        # Поиск идет из нескольких потоков сервиса: слияние новых слов и добавление - под блокировкой,
+        # а name_words только подменяется целиком, поэтому начатый поиск дочитывает свой список
+        self._lock = threading.Lock()
+
+    def add(self, client):
+        phone = normalize_phone(client.phone)
+        # Телефон без цифр ("уточнить") не индексируем, иначе все такие клиенты считались бы дублями
+        if phone:
+            self.by_phone[phone] = client
+        if client.email:
+            self.by_email.setdefault(normalize_email(client.email), []).append(client)
+        words = [(word, client.client_id) for word in set(client.name.casefold().split())]
+        with self._lock:
+            self.pending_words += words
+
+    def find_by_phone(self, phone):
+        phone = normalize_phone(phone)
+        return self.by_phone.get(phone) if phone else None
+
+    def find_by_email(self, email):
+        return list(self.by_email.get(normalize_email(email), []))
+
+    def search_name(self, prefix, limit=20):
+        """Возвращает до limit клиентов, у которых одно из слов имени начинается с prefix"""
+        words = prefix.casefold().split()
+        if not words:
+            return []
+
+        with self._lock:
+            if self.pending_words:
+                # Сортировка склеивает два упорядоченных куска за линейное время
+                self.pending_words.sort()
+                merged = self.name_words + self.pending_words
+                merged.sort()
+                self.name_words = merged
+                self.pending_words = []
+            name_words = self.name_words
+
+        # Ищем по первому слову запроса, остальные слова проверяем у найденных клиентов
+        first, rest = words[0], words[1:]
+        result = []
+        seen = set()
+        index = bisect_left(name_words, (first,))
+        while index < len(name_words) and len(result) < limit:
+            word, client_id = name_words[index]
+            if not word.startswith(first):
+                break
+            index += 1
+            if client_id in seen:
+                continue
+            seen.add(client_id)
+            client = self.clients[client_id]
+            client_words = client.name.casefold().split()
+            if all(any(client_word.startswith(part) for client_word in client_words) for part in rest):
+                result.append(client)
+        return result
@@ -20,6 +20,12 @@ class TimeSlotNotAvailableError(TimeSlotError):
         super().__init__(f"Данное время {time_str} занято.")
 
 
+class OutsideWorkingHoursError(TimeSlotError):
+    """Ошибка: мастер не работает в это время"""
+    def __init__(self, time_str):
+        super().__init__(f"Мастер не работает в {time_str}.")
+
+
 class ServiceNotProvidedError(BeautySalonError):
     """Ошибка: мастер не предоставляет услугу"""
     def __init__(self, master_name, service_name):
@@ -29,3 +35,8 @@ class ServiceNotProvidedError(BeautySalonError):
 class ValidationError(BeautySalonError):
     """Ошибка валидации данных"""
     pass
+
+
+class StorageError(BeautySalonError):
+    """Ошибка хранилища данных"""
+    pass
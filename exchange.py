@@ -0,0 +1,308 @@
+"""Потоковая выгрузка записей салона в CSV, JSON Lines и iCalendar и загрузка их обратно.
+
+Выгрузка: python exchange.py export csv appointments.csv --journal salon_journal.log [--date-from ... --date-to ...
+          --master-id 1 --status confirmed]
+          python exchange.py export ics calendars/ --journal salon_journal.log   (файл .ics на каждого мастера)
+Загрузка: python exchange.py import csv appointments.csv --journal salon_journal.log
+          Записи бронируются заново, как через create_appointment: загружаются только подтвержденные записи
+          на будущие даты в рабочие часы мастера. С --history записи вносятся как есть, с их датой и статусом
+          (история из ночной выгрузки), см. import_history.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from salon import BeautySalon, minutes_to_time
+from journal import SalonJournal
+from storage import SQLiteStorage
+
+
+# Сколько записей собирается в память перед записью на диск
+CHUNK_SIZE = 1000
+
+FIELDS = ("appointment_id", "date", "time_slot", "status", "client_id", "client", "master_id", "master",
+          "service_id", "service", "duration", "price")
+
+ICS_STATUS = {"confirmed": "CONFIRMED", "completed": "CONFIRMED", "cancelled": "CANCELLED"}
+ICS_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def appointment_row(appointment):
+    """Значения полей FIELDS для записи"""
+    client, master, service = appointment.client, appointment.master, appointment.service
+    return (appointment.appointment_id, appointment.date, appointment.time_slot, appointment.status,
+            client.client_id, client.name, master.master_id, master.name,
+            service.service_id, service.name, service.duration, service.price)
+
+
+def iter_chunks(items, size=CHUNK_SIZE):
+    """Разбивает поток на списки не длиннее size"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_csv(salon, path, chunk_size=CHUNK_SIZE, **filters):
+    """Выгружает записи в CSV с заголовком FIELDS; filters - условия BeautySalon.iter_appointments.
+
+    Возвращает число выгруженных записей."""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for chunk in iter_chunks(salon.iter_appointments(**filters), chunk_size):
+            writer.writerows(map(appointment_row, chunk))
+            count += len(chunk)
+    return count
+
+
+def export_jsonl(salon, path, chunk_size=CHUNK_SIZE, **filters):
+    """Выгружает записи в JSON Lines: объект с полями FIELDS на строку. Возвращает число записей"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in iter_chunks(salon.iter_appointments(**filters), chunk_size):
+            f.write("".join(json.dumps(dict(zip(FIELDS, appointment_row(appointment))), ensure_ascii=False) + "\n"
+                            for appointment in chunk))
+            count += len(chunk)
+    return count
+
+
+def export_ics(salon, directory, chunk_size=CHUNK_SIZE, **filters):
+    """Выгружает записи в календари iCalendar, по файлу master_<id>.ics на мастера.
+
+    Записи идут по времени вперемешку у разных мастеров, поэтому события копятся в буфере мастера
+    до chunk_size, а его файл открывается только на время сброса буфера: открытых файлов не больше одного,
+    сколько бы ни было мастеров. Возвращает {id мастера: путь к файлу}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    buffers, paths, written = {}, {}, set()
+    for appointment in salon.iter_appointments(**filters):
+        master = appointment.master
+        buffer = buffers.get(master.master_id)
+        if buffer is None:
+            paths[master.master_id] = os.path.join(directory, f"master_{master.master_id}.ics")
+            buffer = buffers[master.master_id] = [ics_lines(
+                ("BEGIN", "VCALENDAR"), ("VERSION", "2.0"), ("PRODID", f"-//{salon.name}//RU"),
+                ("CALSCALE", "GREGORIAN"), ("X-WR-CALNAME", ics_escape(master.name)))]
+        buffer.append(ics_event(appointment, stamp))
+        if len(buffer) >= chunk_size:
+            _flush_ics(paths, written, master.master_id, buffer)
+    for master_id, buffer in buffers.items():
+        buffer.append(ics_lines(("END", "VCALENDAR")))
+        _flush_ics(paths, written, master_id, buffer)
+    return paths
+
+
+def _flush_ics(paths, written, master_id, buffer):
+    # Первый сброс создает файл заново, следующие дописывают в конец
+    mode = "a" if master_id in written else "w"
+    with open(paths[master_id], mode, encoding="utf-8", newline="") as f:
+        f.write("".join(buffer))
+    written.add(master_id)
+    buffer.clear()
+
+
+def ics_event(appointment, stamp):
+    service = appointment.service
+    start = datetime.fromordinal(appointment.day) + timedelta(minutes=appointment.start)
+    return ics_lines(
+        ("BEGIN", "VEVENT"),
+        ("UID", f"appointment-{appointment.appointment_id}@beauty-salon"),
+        ("DTSTAMP", stamp),
+        ("DTSTART", start.strftime(ICS_TIME_FORMAT)),
+        ("DTEND", (start + timedelta(minutes=service.duration)).strftime(ICS_TIME_FORMAT)),
+        ("SUMMARY", ics_escape(f"{service.name} - {appointment.client.name}")),
+        ("STATUS", ICS_STATUS.get(appointment.status, "TENTATIVE")),
+        # Номера клиента, мастера и услуги нужны, чтобы загрузить календарь обратно
+        ("X-SALON-STATUS", appointment.status),
+        ("X-SALON-CLIENT-ID", appointment.client.client_id),
+        ("X-SALON-MASTER-ID", appointment.master.master_id),
+        ("X-SALON-SERVICE-ID", service.service_id),
+        ("END", "VEVENT"),
+    )
+
+
+def ics_escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def ics_lines(*properties):
+    """Строки свойств iCalendar с переносом длинных строк по 75 байт и окончаниями CRLF"""
+    return "".join(ics_fold(f"{name}:{value}") for name, value in properties)
+
+
+def ics_fold(line):
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Не разрезаем многобайтовый символ
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode("utf-8"))
+        start, limit = end, 74  # строка продолжения начинается с пробела
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def iter_csv(path):
+    """Читает выгрузку CSV: словарь полей на запись (значения - строки)"""
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_ics(path):
+    """Читает события календаря, выгруженного export_ics, в словари с полями как у iter_csv"""
+    event = None
+    for line in _unfolded_lines(path):
+        name, _, value = line.partition(":")
+        name = name.split(";", 1)[0].upper()
+        if name == "BEGIN" and value == "VEVENT":
+            event = {}
+        elif event is None:
+            continue
+        elif name == "END" and value == "VEVENT":
+            start = datetime.strptime(event["DTSTART"][:15], ICS_TIME_FORMAT)
+            uid = event.get("UID", "")
+            yield {
+                "appointment_id": uid[len("appointment-"):].split("@", 1)[0] if uid.startswith("appointment-") else None,
+                "date": start.strftime("%Y-%m-%d"),
+                "time_slot": minutes_to_time(start.hour * 60 + start.minute),
+                "status": event.get("X-SALON-STATUS", event.get("STATUS", "CONFIRMED").lower()),
+                "client_id": event.get("X-SALON-CLIENT-ID"),
+                "master_id": event.get("X-SALON-MASTER-ID"),
+                "service_id": event.get("X-SALON-SERVICE-ID"),
+            }
+            event = None
+        else:
+            event[name] = value
+
+
+def _unfolded_lines(path):
+    with open(path, encoding="utf-8") as f:
+        current = None
+        for line in f:
+            line = line.rstrip("\r\n")
+            if current is not None and line[:1] in (" ", "\t"):
+                current += line[1:]
+                continue
+            if current is not None:
+                yield current
+            current = line
+        if current is not None:
+            yield current
+
+
+READERS = {"csv": iter_csv, "jsonl": iter_jsonl, "ics": iter_ics}
+WRITERS = {"csv": export_csv, "jsonl": export_jsonl, "ics": export_ics}
+
+
+def import_appointments(salon, records, chunk_size=CHUNK_SIZE):
+    """Создает записи из потока словарей (iter_csv, iter_jsonl, iter_ics) пачками через create_appointments_batch.
+
+    Загружаются только подтвержденные записи, номера им назначает салон. Для каждого словаря
+    выдает (словарь, новая запись или None, сообщение).
+    """
+    for chunk in iter_chunks(records, chunk_size):
+        results = [None] * len(chunk)
+        requests, positions = [], []
+        for index, record in enumerate(chunk):
+            status = record.get("status") or "confirmed"
+            if status != "confirmed":
+                results[index] = (record, None, f"Пропущена запись со статусом {status}")
+                continue
+            try:
+                requests.append((int(record["client_id"]), int(record["master_id"]), int(record["service_id"]),
+                                 str(record["date"]), str(record["time_slot"])))
+            except (KeyError, TypeError, ValueError):
+                results[index] = (record, None, "Не хватает клиента, мастера, услуги, даты или времени")
+                continue
+            positions.append(index)
+        for index, (appointment, message) in zip(positions, salon.create_appointments_batch(requests)):
+            results[index] = (chunk[index], appointment, message)
+        yield from results
+
+
+def import_history(salon, records, chunk_size=CHUNK_SIZE):
+    """Вносит записи из потока словарей как есть, с их датой и статусом, пачками через BeautySalon.import_history.
+
+    Для каждого словаря выдает (словарь, новая запись или None, сообщение).
+    """
+    for chunk in iter_chunks(records, chunk_size):
+        results = [None] * len(chunk)
+        requests, positions = [], []
+        for index, record in enumerate(chunk):
+            try:
+                requests.append((int(record["client_id"]), int(record["master_id"]), int(record["service_id"]),
+                                 str(record["date"]), str(record["time_slot"]), record.get("status") or "confirmed"))
+            except (KeyError, TypeError, ValueError):
+                results[index] = (record, None, "Не хватает клиента, мастера, услуги, даты или времени")
+                continue
+            positions.append(index)
+        for index, (appointment, message) in zip(positions, salon.import_history(requests)):
+            results[index] = (chunk[index], appointment, message)
+        yield from results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка записей салона")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("format", choices=sorted(WRITERS))
+    parser.add_argument("path", help="файл (для export ics - каталог)")
+    parser.add_argument("--journal", help="файл журнала салона (как у графического интерфейса)")
+    parser.add_argument("--db", help="база SQLite вместо журнала")
+    parser.add_argument("--date-from")
+    parser.add_argument("--date-to")
+    parser.add_argument("--master-id", type=int)
+    parser.add_argument("--status")
+    parser.add_argument("--history", action="store_true",
+                        help="import: вносить записи как есть, с датой и статусом из файла")
+    args = parser.parse_args()
+
+    salon = BeautySalon("Элит Салон")
+    storage = None
+    if args.db:
+        storage = SQLiteStorage(args.db)
+    elif args.journal:
+        storage = SalonJournal(args.journal)
+    if storage is not None:
+        storage.load(salon)
+
+    try:
+        if args.action == "export":
+            result = WRITERS[args.format](salon, args.path, master_id=args.master_id, status=args.status,
+                                          date_from=args.date_from, date_to=args.date_to)
+            print(f"Выгружено календарей: {len(result)}" if args.format == "ics" else f"Выгружено записей: {result}")
+        else:
+            created = failed = 0
+            load = import_history if args.history else import_appointments
+            for record, appointment, message in load(salon, READERS[args.format](args.path)):
+                if appointment is not None:
+                    created += 1
+                else:
+                    failed += 1
+                    print(f"{record.get('date')} {record.get('time_slot')}: {message}", file=sys.stderr)
+            print(f"Загружено записей: {created}, не загружено: {failed}")
+    finally:
+        if storage is not None:
+            storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
+from itertools import islice
 from salon import BeautySalon, TimeValidator
+from journal import SalonJournal
+from occupancy import OccupancyMatrix, HAS_NUMPY
+from workers import TkQueryRunner
 from exceptions import BeautySalonError
 
+# Файл журнала, в котором сохраняются клиенты, мастера и записи между запусками
+JOURNAL_PATH = "salon_journal.log"
+# Сколько клиентов показывать в выпадающем списке
+CLIENT_LIST_LIMIT = 50
+# Сколько записей показывать на одной странице списка записей
+APPOINTMENTS_PAGE_SIZE = 100
+# Фильтр списка записей по статусу
+STATUS_FILTERS = {"Все": None, "Подтверждена": "confirmed", "Отменена": "cancelled", "Завершена": "completed"}
+# Через сколько мс после изменения услуги, мастера или даты автоматически искать время
+SLOT_SEARCH_DELAY = 300
+# Календарь загрузки: периоды, цвета свободной ячейки, услуги, перерыва и нерабочего времени, размеры в пикселях
+OCCUPANCY_PERIODS = {"Неделя": 7, "Месяц": 30}
+OCCUPANCY_COLORS = ("#ffffff", "#e57373", "#ffd54f", "#cfd8dc")
+OCCUPANCY_CELL_WIDTH = 3
+OCCUPANCY_ROW_HEIGHT = 12
+OCCUPANCY_LABEL_WIDTH = 200
+OCCUPANCY_HEADER_HEIGHT = 16
+# Дни недели для графика мастеров, по порядку с понедельника
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
 class BeautySalonGUI:
     def __init__(self, root):
         self.root = root
@@ -12,8 +36,21 @@ class BeautySalonGUI:
         
         self.salon = BeautySalon("Элит Салон")
         self.validator = TimeValidator()
-        self.setup_salon_data()
+        self.journal = SalonJournal(JOURNAL_PATH)
+        self.journal.load(self.salon)
+        # Тестовые данные добавляем только при первом запуске, дальше они восстанавливаются из журнала
+        if not self.salon.services:
+            self.setup_salon_data()
+        # Поиск времени и создание записей выполняются в фоне, чтобы окно не зависало
+        self.worker = TkQueryRunner(self.root)
         self.create_widgets()
+        self.refresh_appointments()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+    def on_close(self):
+        self.worker.shutdown()
+        self.journal.close()
+        self.root.destroy()
         
     def setup_salon_data(self):
         """Наполняем салон тестовыми данными"""
@@ -95,6 +132,9 @@ class BeautySalonGUI:
         # Вкладка просмотра записей
         self.create_appointments_tab(notebook)
         
+        # Вкладка загрузки мастеров
+        self.create_occupancy_tab(notebook)
+        
         # Вкладка управления
         self.create_management_tab(notebook)
         
@@ -106,10 +146,16 @@ class BeautySalonGUI:
         ttk.Label(frame, text="Клиент:").grid(row=0, column=0, sticky='w', padx=5, pady=5)
         self.client_var = tk.StringVar()
         self.client_combo = ttk.Combobox(frame, textvariable=self.client_var, state="readonly")
+        self.client_search_var = tk.StringVar()
         self.update_client_combo()
         self.client_combo.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
         self.client_combo.bind('<<ComboboxSelected>>', self.on_client_select)
         
+        # Поиск клиента по имени, телефону или email
+        client_search = ttk.Entry(frame, textvariable=self.client_search_var, width=20)
+        client_search.grid(row=0, column=2, padx=5, pady=5)
+        client_search.bind('<KeyRelease>', lambda event: self.update_client_combo())
+        
         # Услуга
         ttk.Label(frame, text="Услуга:").grid(row=1, column=0, sticky='w', padx=5, pady=5)
         self.service_var = tk.StringVar()
@@ -124,12 +170,14 @@ class BeautySalonGUI:
         self.master_var = tk.StringVar()
         self.master_combo = ttk.Combobox(frame, textvariable=self.master_var, state="readonly")
         self.master_combo.grid(row=2, column=1, padx=5, pady=5, sticky='ew')
+        self.master_combo.bind('<<ComboboxSelected>>', lambda event: self.schedule_slot_search())
         
         # Дата
         ttk.Label(frame, text="Дата:").grid(row=3, column=0, sticky='w', padx=5, pady=5)
         self.date_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-%d"))
         date_entry = ttk.Entry(frame, textvariable=self.date_var)
         date_entry.grid(row=3, column=1, padx=5, pady=5, sticky='ew')
+        self.date_var.trace_add('write', lambda *args: self.schedule_slot_search())
         
         # Время
         ttk.Label(frame, text="Время:").grid(row=4, column=0, sticky='w', padx=5, pady=5)
@@ -141,13 +189,17 @@ class BeautySalonGUI:
         ttk.Button(frame, text="Найти доступное время", 
                   command=self.find_available_time).grid(row=5, column=0, columnspan=2, pady=10)
         
+        # Кнопка поиска ближайшего времени у любого мастера
+        ttk.Button(frame, text="Ближайшее время у любого мастера", 
+                  command=self.find_earliest_time).grid(row=6, column=0, columnspan=2, pady=10)
+        
         # Кнопка создания записи
         ttk.Button(frame, text="Создать запись", 
-                  command=self.create_appointment).grid(row=6, column=0, columnspan=2, pady=10)
+                  command=self.create_appointment).grid(row=7, column=0, columnspan=2, pady=10)
         
         # Статус
         self.status_label = ttk.Label(frame, text="", foreground="blue")
-        self.status_label.grid(row=7, column=0, columnspan=2, pady=5)
+        self.status_label.grid(row=8, column=0, columnspan=2, pady=5)
         
         # Настройка веса колонок для правильного растяжения
         frame.columnconfigure(1, weight=1)
@@ -156,7 +208,19 @@ class BeautySalonGUI:
         frame = ttk.Frame(notebook)
         notebook.add(frame, text="Мои записи")
         
-        # Список записей
+        # Фильтр по статусу
+        filter_frame = ttk.Frame(frame)
+        filter_frame.pack(fill='x', padx=5, pady=5)
+        ttk.Label(filter_frame, text="Статус:").pack(side='left', padx=5)
+        self.status_filter_var = tk.StringVar(value="Все")
+        status_filter = ttk.Combobox(filter_frame, textvariable=self.status_filter_var,
+                                     values=list(STATUS_FILTERS), state="readonly", width=15)
+        status_filter.pack(side='left', padx=5)
+        status_filter.bind('<<ComboboxSelected>>', lambda event: self.show_appointments_page(0))
+        
+        # Список записей: в таблице держим только текущую страницу, новые записи сверху
+        self.appointments_page = 0
+        self.seen_change = 0  # номер последнего изменения салона, отраженного в списке
         self.appointments_tree = ttk.Treeview(frame, columns=('ID', 'Клиент', 'Мастер', 'Услуга', 'Дата', 'Время', 'Статус'), show='headings')
         
         columns = {
@@ -184,6 +248,45 @@ class BeautySalonGUI:
         ttk.Button(btn_frame, text="Отменить запись", 
                   command=self.cancel_selected_appointment).pack(side='left', padx=5)
         
+        # Переключение страниц
+        ttk.Button(btn_frame, text="Вперед >", 
+                  command=lambda: self.show_appointments_page(self.appointments_page + 1)).pack(side='right', padx=5)
+        self.page_label = ttk.Label(btn_frame, text="Страница 1")
+        self.page_label.pack(side='right', padx=5)
+        ttk.Button(btn_frame, text="< Назад", 
+                  command=lambda: self.show_appointments_page(self.appointments_page - 1)).pack(side='right', padx=5)
+        
+    def create_occupancy_tab(self, notebook):
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text="Загрузка")
+        
+        controls = ttk.Frame(frame)
+        controls.pack(fill='x', padx=5, pady=5)
+        ttk.Label(controls, text="С даты:").pack(side='left', padx=5)
+        self.occupancy_date_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-%d"))
+        ttk.Entry(controls, textvariable=self.occupancy_date_var, width=12).pack(side='left', padx=5)
+        self.occupancy_period_var = tk.StringVar(value="Неделя")
+        ttk.Combobox(controls, textvariable=self.occupancy_period_var, values=list(OCCUPANCY_PERIODS),
+                     state="readonly", width=10).pack(side='left', padx=5)
+        ttk.Button(controls, text="Показать", command=self.show_occupancy).pack(side='left', padx=5)
+        self.occupancy_status = ttk.Label(controls, text="")
+        self.occupancy_status.pack(side='left', padx=5)
+        
+        # Календарь: строка на пару (мастер, день), по горизонтали 5-минутные ячейки рабочего дня
+        canvas_frame = ttk.Frame(frame)
+        canvas_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        self.occupancy_canvas = tk.Canvas(canvas_frame, background="white")
+        y_scroll = ttk.Scrollbar(canvas_frame, orient='vertical', command=self.occupancy_canvas.yview)
+        x_scroll = ttk.Scrollbar(canvas_frame, orient='horizontal', command=self.occupancy_canvas.xview)
+        self.occupancy_canvas.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        y_scroll.pack(side='right', fill='y')
+        x_scroll.pack(side='bottom', fill='x')
+        self.occupancy_canvas.pack(side='left', fill='both', expand=True)
+        self.occupancy_image = None  # ссылка на картинку, иначе Tk ее не покажет
+        
+        if not HAS_NUMPY:
+            self.occupancy_status.config(text="Для календаря загрузки установите numpy")
+        
     def create_management_tab(self, notebook):
         frame = ttk.Frame(notebook)
         notebook.add(frame, text="Управление")
@@ -206,12 +309,40 @@ class BeautySalonGUI:
         ttk.Button(frame, text="Добавить клиента", 
                   command=self.add_new_client).grid(row=4, column=0, columnspan=2, pady=10)
         
+        # Рабочие часы мастера: на день недели или на конкретную дату
+        ttk.Label(frame, text="Рабочие часы мастера", font=('Arial', 12, 'bold')).grid(row=5, column=0, columnspan=2, pady=10)
+        
+        ttk.Label(frame, text="Мастер:").grid(row=6, column=0, sticky='w', padx=5, pady=5)
+        self.hours_master_var = tk.StringVar()
+        ttk.Combobox(frame, textvariable=self.hours_master_var, state="readonly",
+                     values=[f"{m.master_id}: {m.name}" for m in self.salon.masters.values()]
+                     ).grid(row=6, column=1, padx=5, pady=5, sticky='ew')
+        
+        ttk.Label(frame, text="День недели или дата:").grid(row=7, column=0, sticky='w', padx=5, pady=5)
+        self.hours_day_var = tk.StringVar(value=WEEKDAYS[0])
+        ttk.Combobox(frame, textvariable=self.hours_day_var, values=WEEKDAYS).grid(row=7, column=1, padx=5, pady=5, sticky='ew')
+        
+        ttk.Label(frame, text="Часы:").grid(row=8, column=0, sticky='w', padx=5, pady=5)
+        self.hours_var = tk.StringVar(value="09:00-21:00")
+        ttk.Entry(frame, textvariable=self.hours_var, width=30).grid(row=8, column=1, padx=5, pady=5, sticky='ew')
+        ttk.Label(frame, text="Например: 10:00-14:00, 15:00-21:00; пусто - выходной",
+                  foreground="gray").grid(row=9, column=1, sticky='w', padx=5)
+        
+        ttk.Button(frame, text="Сохранить часы", 
+                  command=self.save_master_hours).grid(row=10, column=0, columnspan=2, pady=10)
+        
         # Настройка веса колонок
         frame.columnconfigure(1, weight=1)
         
     def update_client_combo(self):
-        """Обновляет список клиентов в выпадающем меню"""
-        clients_list = [f"{c.client_id}: {c.name} ({c.phone})" for c in self.salon.clients.values()]
+        """Обновляет список клиентов в выпадающем меню по строке поиска"""
+        query = self.client_search_var.get()
+        if query.strip():
+            clients = self.salon.search_clients(query, limit=CLIENT_LIST_LIMIT)
+        else:
+            # Без поиска показываем последних добавленных клиентов
+            clients = islice(reversed(self.salon.clients.values()), CLIENT_LIST_LIMIT)
+        clients_list = [f"{c.client_id}: {c.name} ({c.phone})" for c in clients]
         self.client_combo['values'] = clients_list
         if clients_list:
             self.client_combo.set(clients_list[0])
@@ -286,53 +417,95 @@ class BeautySalonGUI:
         
     def on_service_select(self, event):
         self.update_masters()
+        self.schedule_slot_search()
+        
+    def schedule_slot_search(self):
+        """Отменяет устаревший поиск времени и запускает новый, когда пользователь перестанет менять поля"""
+        self.worker.cancel("slots")
+        self.worker.debounce("slots", SLOT_SEARCH_DELAY, lambda: self.find_available_time(show_errors=False))
         
     def update_masters(self):
         """Обновляет список мастеров в зависимости от выбранной услуги"""
         try:
             service_id = int(self.service_var.get().split(':')[0])
-            service = self.salon.services.get(service_id)
+            available_masters = [f"{master.master_id}: {master.name}"
+                                 for master in self.salon.get_masters_for_service(service_id)]
             
-            if service:
-                available_masters = []
-                for master in self.salon.masters.values():
-                    if service.name in master.specialization:
-                        available_masters.append(f"{master.master_id}: {master.name}")
-                
-                self.master_combo['values'] = available_masters
-                if available_masters:
-                    self.master_combo.set(available_masters[0])
+            self.master_combo['values'] = available_masters
+            if available_masters:
+                self.master_combo.set(available_masters[0])
         except (ValueError, IndexError):
             pass
         
-    def find_available_time(self):
-        """Находит доступное время для записи"""
+    def find_available_time(self, show_errors=True):
+        """Запускает поиск доступного времени для записи"""
         try:
             if not all([self.client_var.get(), self.service_var.get(), self.master_var.get(), self.date_var.get()]):
-                messagebox.showerror("Ошибка", "Заполните все поля")
+                if show_errors:
+                    messagebox.showerror("Ошибка", "Заполните все поля")
                 return
                 
             master_id = int(self.master_var.get().split(':')[0])
             service_id = int(self.service_var.get().split(':')[0])
             service = self.salon.services.get(service_id)
             
-            available_slots = self.salon.get_available_time_slots(
-                master_id, self.date_var.get(), service.duration
-            )
+            self.status_label.config(text="Поиск доступного времени...")
+            self.worker.submit("slots", self.salon.get_available_time_slots,
+                               master_id, self.date_var.get(), service.duration,
+                               on_done=self.show_available_slots, on_error=self.show_search_error)
+                
+        except Exception as e:
+            if show_errors:
+                self.show_search_error(e)
+            
+    def show_available_slots(self, available_slots):
+        self.time_combo['values'] = available_slots
+        if available_slots:
+            self.time_combo.set(available_slots[0])
+            self.status_label.config(text=f"Найдено {len(available_slots)} доступных слотов")
+        else:
+            self.status_label.config(text="Нет доступных слотов на выбранную дату")
+            self.time_combo.set('')
+            
+    def show_search_error(self, error):
+        self.status_label.config(text="")
+        messagebox.showerror("Ошибка", f"Ошибка при поиске времени: {str(error)}")
             
-            self.time_combo['values'] = available_slots
-            if available_slots:
-                self.time_combo.set(available_slots[0])
-                self.status_label.config(text=f"Найдено {len(available_slots)} доступных слотов")
-            else:
-                self.status_label.config(text="Нет доступных слотов на выбранную дату")
-                self.time_combo.set('')
+    def find_earliest_time(self):
+        """Запускает поиск ближайшего свободного времени у всех мастеров, выполняющих услугу"""
+        try:
+            if not all([self.service_var.get(), self.date_var.get()]):
+                messagebox.showerror("Ошибка", "Выберите услугу и дату")
+                return
                 
+            service_id = int(self.service_var.get().split(':')[0])
+            date_from = datetime.strptime(self.date_var.get(), "%Y-%m-%d")
+            date_to = (date_from + timedelta(days=14)).strftime("%Y-%m-%d")
+            
+            self.status_label.config(text="Поиск ближайшего времени...")
+            self.worker.submit("slots", self.salon.find_earliest_slots,
+                               service_id, self.date_var.get(), date_to, 1,
+                               on_done=self.show_earliest_slot, on_error=self.show_search_error)
+            
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при поиске времени: {str(e)}")
+            self.show_search_error(e)
+            
+    def show_earliest_slot(self, options):
+        if not options:
+            self.status_label.config(text="Нет свободного времени в ближайшие 2 недели")
+            return
+            
+        master, date, time_slot = options[0]
+        self.master_var.set(f"{master.master_id}: {master.name}")
+        self.date_var.set(date)
+        # Смена даты запланировала бы поиск по одному мастеру - время уже найдено
+        self.worker.cancel("slots")
+        self.time_combo['values'] = [time_slot]
+        self.time_combo.set(time_slot)
+        self.status_label.config(text=f"Ближайшее время: {date} {time_slot}, мастер {master.name}")
             
     def create_appointment(self):
-        """Создает новую запись"""
+        """Создает новую запись в фоне"""
         try:
             if not all([self.client_var.get(), self.service_var.get(), 
                        self.master_var.get(), self.date_var.get(), self.time_var.get()]):
@@ -343,38 +516,151 @@ class BeautySalonGUI:
             master_id = int(self.master_var.get().split(':')[0])
             service_id = int(self.service_var.get().split(':')[0])
             
-            appointment, message = self.salon.create_appointment(
-                client_id, master_id, service_id, 
-                self.date_var.get(), self.time_var.get()
-            )
-            
-            if appointment:
-                messagebox.showinfo("Успех", message)
-                self.status_label.config(text="Запись создана успешно!")
-                self.refresh_appointments()
-                # Очищаем поля после успешной записи
-                self.time_var.set('')
-            else:
-                messagebox.showerror("Ошибка", message)
+            self.status_label.config(text="Создание записи...")
+            self.worker.submit("booking", self.salon.create_appointment,
+                               client_id, master_id, service_id, self.date_var.get(), self.time_var.get(),
+                               on_done=self.on_appointment_created, on_error=self.show_booking_error)
                 
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при создании записи: {str(e)}")
+            self.show_booking_error(e)
+            
+    def on_appointment_created(self, result):
+        appointment, message = result
+        if appointment:
+            messagebox.showinfo("Успех", message)
+            self.status_label.config(text="Запись создана успешно!")
+            self.apply_appointment_changes()
+            # Очищаем поля после успешной записи
+            self.time_var.set('')
+        else:
+            self.status_label.config(text="")
+            messagebox.showerror("Ошибка", message)
+            
+    def show_booking_error(self, error):
+        self.status_label.config(text="")
+        messagebox.showerror("Ошибка", f"Ошибка при создании записи: {str(error)}")
+            
+    def show_occupancy(self):
+        """Строит матрицу загрузки за выбранный период в фоне"""
+        if not HAS_NUMPY:
+            messagebox.showerror("Ошибка", "Для календаря загрузки установите numpy")
+            return
+        self.occupancy_status.config(text="Построение календаря...")
+        self.worker.submit("occupancy", OccupancyMatrix, self.salon, self.occupancy_date_var.get(),
+                           OCCUPANCY_PERIODS[self.occupancy_period_var.get()],
+                           on_done=self.draw_occupancy, on_error=self.show_occupancy_error)
+        
+    def show_occupancy_error(self, error):
+        self.occupancy_status.config(text="")
+        messagebox.showerror("Ошибка", f"Ошибка при построении календаря: {str(error)}")
+        
+    def draw_occupancy(self, matrix):
+        """Рисует матрицу загрузки одной картинкой: пиксель на ячейку, увеличенный до размеров ячейки"""
+        canvas = self.occupancy_canvas
+        canvas.delete('all')
+        if not matrix.masters:
+            self.occupancy_status.config(text="Нет мастеров")
+            return
+            
+        left, top = OCCUPANCY_LABEL_WIDTH, OCCUPANCY_HEADER_HEIGHT
+        width = matrix.slots * OCCUPANCY_CELL_WIDTH
+        
+        # Шкала часов
+        for slot in range(0, matrix.slots, 60 // matrix.slot_minutes):
+            canvas.create_text(left + slot * OCCUPANCY_CELL_WIDTH, top // 2, text=matrix.slot_time(slot),
+                               anchor='w', font=('Arial', 7))
             
+        image = tk.PhotoImage(width=matrix.slots, height=len(matrix.masters) * matrix.days)
+        image.put(matrix.to_photo_data(OCCUPANCY_COLORS))
+        self.occupancy_image = image.zoom(OCCUPANCY_CELL_WIDTH, OCCUPANCY_ROW_HEIGHT)
+        canvas.create_image(left, top, image=self.occupancy_image, anchor='nw')
+        
+        # Подписи строк: дата, у первого дня мастера - имя и его загрузка за период
+        utilization = matrix.utilization_per_master()
+        dates = matrix.dates()
+        for master_index, master in enumerate(matrix.masters):
+            for day_index, date in enumerate(dates):
+                y = top + (master_index * matrix.days + day_index) * OCCUPANCY_ROW_HEIGHT
+                text = date[5:]
+                if day_index == 0:
+                    text += f"  {master.name} ({utilization[master_index]:.0%})"
+                canvas.create_text(4, y + OCCUPANCY_ROW_HEIGHT // 2, text=text, anchor='w', font=('Arial', 7))
+            y = top + (master_index + 1) * matrix.days * OCCUPANCY_ROW_HEIGHT
+            canvas.create_line(left, y, left + width, y, fill="#9e9e9e")
+            
+        canvas.configure(scrollregion=canvas.bbox('all'))
+        self.occupancy_status.config(text=f"Загрузка салона за период: {utilization.mean():.0%}")
+        
+    def show_appointments_page(self, page):
+        """Переходит на страницу списка записей"""
+        self.appointments_page = max(page, 0)
+        self.refresh_appointments()
+        
+    def get_page_appointments(self):
+        """Возвращает записи текущей страницы с учетом фильтра, новые сверху"""
+        return self.salon.query_appointments(status=STATUS_FILTERS[self.status_filter_var.get()],
+                                             offset=self.appointments_page * APPOINTMENTS_PAGE_SIZE,
+                                             limit=APPOINTMENTS_PAGE_SIZE, order_by="id", newest_first=True)
+        
+    @staticmethod
+    def appointment_row(appointment):
+        return (
+            appointment.appointment_id,
+            appointment.client.name,
+            appointment.master.name,
+            appointment.service.name,
+            appointment.date,
+            appointment.time_slot,
+            appointment.status
+        )
+        
     def refresh_appointments(self):
-        """Обновляет список записей"""
-        for item in self.appointments_tree.get_children():
-            self.appointments_tree.delete(item)
+        """Полностью перерисовывает текущую страницу списка записей"""
+        self.seen_change = self.salon.change_seq
+        self.appointments_tree.delete(*self.appointments_tree.get_children())
+            
+        for appointment in self.get_page_appointments():
+            self.appointments_tree.insert('', 'end', iid=str(appointment.appointment_id),
+                                          values=self.appointment_row(appointment))
+        self.page_label.config(text=f"Страница {self.appointments_page + 1}")
+        
+    def apply_appointment_changes(self):
+        """Обновляет в списке только записи, изменившиеся после последнего обновления"""
+        self.seen_change, changed_ids = self.salon.get_changes(self.seen_change)
+        if changed_ids is None:
+            # Лента изменений уже обрезана - перерисовываем страницу целиком
+            self.refresh_appointments()
+            return
             
-        for appointment in self.salon.appointments.values():
-            self.appointments_tree.insert('', 'end', values=(
-                appointment.appointment_id,
-                appointment.client.name,
-                appointment.master.name,
-                appointment.service.name,
-                appointment.date,
-                appointment.time_slot,
-                appointment.status
-            ))
+        status = STATUS_FILTERS[self.status_filter_var.get()]
+        tree = self.appointments_tree
+        for appointment_id in dict.fromkeys(changed_ids):
+            appointment = self.salon.appointments[appointment_id]
+            iid = str(appointment_id)
+            matches = status is None or appointment.status == status
+            if tree.exists(iid):
+                if matches:
+                    tree.item(iid, values=self.appointment_row(appointment))
+                else:
+                    tree.delete(iid)
+                continue
+            if not matches:
+                continue
+                
+            # Строки упорядочены по убыванию id: ищем место новой записи на странице
+            rows = tree.get_children()
+            position = 0
+            while position < len(rows) and int(rows[position]) > appointment_id:
+                position += 1
+            if position == 0 and self.appointments_page > 0:
+                continue  # запись относится к одной из предыдущих страниц
+            if position < APPOINTMENTS_PAGE_SIZE:
+                tree.insert('', position, iid=iid, values=self.appointment_row(appointment))
+                
+        # Лишние строки уходят на следующую страницу
+        rows = tree.get_children()
+        if len(rows) > APPOINTMENTS_PAGE_SIZE:
+            tree.delete(*rows[APPOINTMENTS_PAGE_SIZE:])
             
     def cancel_selected_appointment(self):
         """Отменяет выбранную запись"""
@@ -388,7 +674,7 @@ class BeautySalonGUI:
         
         if success:
             messagebox.showinfo("Успех", message)
-            self.refresh_appointments()
+            self.apply_appointment_changes()
         else:
             messagebox.showerror("Ошибка", message)
             
@@ -427,6 +713,32 @@ class BeautySalonGUI:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при добавлении клиента: {str(e)}")
 
+    def save_master_hours(self):
+        """Сохраняет график мастера на день недели или исключение на дату"""
+        try:
+            if not self.hours_master_var.get():
+                messagebox.showerror("Ошибка", "Выберите мастера")
+                return
+                
+            master_id = int(self.hours_master_var.get().split(':')[0])
+            intervals = [part.split('-') for part in self.hours_var.get().replace(' ', '').split(',') if part]
+            if any(len(interval) != 2 for interval in intervals):
+                messagebox.showerror("Ошибка", "Укажите часы в виде 10:00-14:00, 15:00-21:00")
+                return
+                
+            day = self.hours_day_var.get().strip()
+            if day in WEEKDAYS:
+                self.salon.set_master_hours(master_id, WEEKDAYS.index(day), intervals)
+            else:
+                self.salon.set_master_day_hours(master_id, day, intervals)
+            messagebox.showinfo("Успех", "График мастера сохранен")
+            
+            # Свободное время на вкладке записи могло измениться
+            self.schedule_slot_search()
+            
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при сохранении графика: {str(e)}")
+
 def main():
     root = tk.Tk()
     app = BeautySalonGUI(root)
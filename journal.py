@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+
+from salon import Client, Service, Master, Appointment, DEFAULT_HOURS, date_to_ordinal, ordinal_to_date, time_to_minutes
+from exceptions import StorageError
+
+
+class SalonJournal:
+    """Журнал изменений салона: каждая операция дописывается в конец файла,
+    периодически состояние сохраняется снимком, а журнал обрезается.
+
+    Формат записи журнала - JSON-массив в одну строку: [номер, операция, данные...]
+    c - клиент, s - услуга, m - мастер, h - рабочие часы мастера, a - запись,
+    t - смена статуса записи (отмена или завершение).
+    """
+
+    def __init__(self, path, snapshot_every=1000, fsync=True):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.snapshot_every = snapshot_every  # через сколько записей делать снимок
+        self.fsync = fsync
+        self.salon = None
+        self.seq = 0  # номер последней записи журнала
+        self.records_since_snapshot = 0
+        self._file = None
+        # Записи из разных потоков не перемешиваются; салон держит блокировку и пока вносит изменение
+        self.lock = threading.RLock()
+
+    def load(self, salon):
+        """Восстанавливает состояние салона (снимок + хвост журнала) и начинает записывать изменения"""
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot_seq = self.seq = snapshot["seq"]
+            self._restore_snapshot(salon, snapshot)
+
+        if os.path.exists(self.path):
+            valid_size = 0
+            with open(self.path, "rb") as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная последняя строка после сбоя - отрезаем ее
+                        if not line.endswith(b"\n"):
+                            break
+                        raise StorageError(f"Поврежден журнал {self.path}, строка {line_number}")
+                    valid_size += len(line)
+                    self.seq = record[0]
+                    # Записи, уже вошедшие в снимок, пропускаем
+                    if self.seq > snapshot_seq:
+                        self._apply(salon, record)
+                        self.records_since_snapshot += 1
+            if valid_size != os.path.getsize(self.path):
+                os.truncate(self.path, valid_size)
+
+        self.salon = salon
+        self._file = open(self.path, "a", encoding="utf-8")
+        salon.storage = self
+        return salon
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.salon is not None and self.salon.storage is self:
+            self.salon.storage = None
+
+    def record_client(self, client):
+        self._append("c", client.client_id, client.name, client.phone, client.email)
+
+    def record_service(self, service):
+        self._append("s", service.service_id, service.name, service.duration, service.price, service.category)
+
+    def record_master(self, master):
+        self._append("m", master.master_id, master.name, master.specialization, master.phone,
+                     master.break_duration)
+
+    def record_hours(self, item):
+        self._append("h", *self._hours_fields(*item))
+
+    def record_appointment(self, appointment):
+        self._append(*self._appointment_fields(appointment))
+
+    def record_appointments(self, appointments):
+        """Записывает несколько записей с одним сбросом на диск"""
+        with self.lock:
+            self._compact_if_due()
+            for appointment in appointments:
+                self._write(self._appointment_fields(appointment))
+            self._sync()
+
+    def record_status(self, appointment):
+        self._append("t", appointment.appointment_id, appointment.status)
+
+    def _append(self, *fields):
+        with self.lock:
+            self._compact_if_due()
+            self._write(fields)
+            self._sync()
+
+    def _write(self, fields):
+        self.seq += 1
+        self._file.write(json.dumps([self.seq, *fields], ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.records_since_snapshot += 1
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _compact_if_due(self):
+        # Снимок делается перед следующей записью: к этому моменту салон уже внес все предыдущие
+        if self.records_since_snapshot >= self.snapshot_every:
+            self._compact()
+
+    def compact(self):
+        """Сохраняет снимок текущего состояния и очищает журнал"""
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        salon = self.salon
+        snapshot = {
+            "seq": self.seq,
+            "clients": [[c.client_id, c.name, c.phone, c.email] for c in salon.clients.values()],
+            "services": [[s.service_id, s.name, s.duration, s.price, s.category] for s in salon.services.values()],
+            "masters": [[m.master_id, m.name, m.specialization, m.phone, m.break_duration]
+                        for m in salon.masters.values()],
+            "hours": self._snapshot_hours(salon),
+            "appointments": [[a.appointment_id, a.client.client_id, a.master.master_id, a.service.service_id,
+                              a.date, a.time_slot, a.status] for a in salon.appointments.values()],
+            "next_ids": [salon.next_client_id, salon.next_service_id, salon.next_master_id,
+                         salon.next_appointment_id],
+        }
+
+        # Снимок пишется во временный файл и атомарно подменяет старый
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Если сбой случится до обрезки, записи журнала с номером <= seq будут пропущены при загрузке
+        self._file.close()
+        self._file = open(self.path, "w", encoding="utf-8")
+        self.records_since_snapshot = 0
+
+    @staticmethod
+    def _hours_fields(master_id, weekday, day, hours):
+        """[id мастера, день недели или null, дата или null, [[начало, конец], ...] или null]"""
+        return [master_id, weekday, ordinal_to_date(day) if day is not None else None,
+                [list(interval) for interval in hours] if hours is not None else None]
+
+    @classmethod
+    def _snapshot_hours(cls, salon):
+        """Графики мастеров, отличающиеся от графика по умолчанию"""
+        hours = []
+        for master in salon.masters.values():
+            for weekday, template in enumerate(master.week_hours):
+                if template != DEFAULT_HOURS:
+                    hours.append(cls._hours_fields(master.master_id, weekday, None, template))
+            for day, template in master.day_hours.items():
+                hours.append(cls._hours_fields(master.master_id, None, day, template))
+        return hours
+
+    @staticmethod
+    def _hours_item(master_id, weekday, date, hours):
+        return (master_id, weekday, date_to_ordinal(date) if date is not None else None,
+                [tuple(interval) for interval in hours] if hours is not None else None)
+
+    @staticmethod
+    def _appointment_fields(appointment):
+        return ("a", appointment.appointment_id, appointment.client.client_id, appointment.master.master_id,
+                appointment.service.service_id, appointment.date, appointment.time_slot)
+
+    @staticmethod
+    def _restore_snapshot(salon, snapshot):
+        for client_id, name, phone, email in snapshot["clients"]:
+            salon._register_client(Client(client_id, name, phone, email))
+        for service_id, name, duration, price, category in snapshot["services"]:
+            salon._register_service(Service(service_id, name, duration, price, category))
+        for master_id, name, specialization, phone, break_duration in snapshot["masters"]:
+            salon._register_master(Master(master_id, name, specialization, phone, break_duration))
+        for fields in snapshot.get("hours", []):
+            salon._register_hours(SalonJournal._hours_item(*fields))
+        for appointment_id, client_id, master_id, service_id, date, time_slot, status in snapshot["appointments"]:
+            appointment = Appointment(appointment_id, salon.clients[client_id], salon.masters[master_id],
+                                      salon.services[service_id], date_to_ordinal(date), time_to_minutes(time_slot))
+            appointment.status = status
+            salon._register_appointment(appointment)
+        (salon.next_client_id, salon.next_service_id,
+         salon.next_master_id, salon.next_appointment_id) = snapshot["next_ids"]
+
+    @staticmethod
+    def _apply(salon, record):
+        operation, fields = record[1], record[2:]
+        if operation == "c":
+            salon._register_client(Client(*fields))
+        elif operation == "s":
+            salon._register_service(Service(*fields))
+        elif operation == "m":
+            salon._register_master(Master(*fields))
+        elif operation == "h":
+            salon._register_hours(SalonJournal._hours_item(*fields))
+        elif operation == "a":
+            appointment_id, client_id, master_id, service_id, date, time_slot = fields
+            salon._register_appointment(Appointment(appointment_id, salon.clients[client_id], salon.masters[master_id],
+                                                    salon.services[service_id], date_to_ordinal(date),
+                                                    time_to_minutes(time_slot)))
+        elif operation == "t":
+            appointment_id, status = fields
+            if status == "cancelled":
+                salon.appointments[appointment_id].cancel()
+            elif status == "completed":
+                salon.appointments[appointment_id].complete()
+            else:
+                raise StorageError(f"Неизвестный статус записи в журнале: {status}")
+        else:
+            raise StorageError(f"Неизвестная операция журнала: {operation}")
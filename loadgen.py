@@ -0,0 +1,72 @@
+"""Нагрузочный клиент для server.py: держит несколько соединений и измеряет пропускную способность.
+
+Запуск: python loadgen.py --port 8080 --connections 16 --requests 5000 --path "/slots?master_id=1&service_id=1&date=2024-01-15"
+"""
+import argparse
+import asyncio
+import json
+import time
+
+
+async def run_connection(host, port, path, count, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1")
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not status_line.split(b" ")[1].startswith(b"2"):
+                errors.append(status_line)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, path, connections, requests):
+    latencies, errors = [], []
+    per_connection = max(requests // connections, 1)
+    started = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, path, per_connection, latencies, errors)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный клиент для сервиса записи")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="/slots?master_id=1&service_id=1&date=2030-01-15")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.host, args.port, args.path, args.connections, args.requests))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+
+# Верхние границы корзин гистограммы задержек, в микросекундах
+LATENCY_BUCKETS_US = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+
+class OperationStats:
+    """Число вызовов и гистограмма задержек одной операции"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0  # суммарное время в секундах
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_US) + 1)  # последняя корзина - все, что дольше
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS_US, seconds * 1e6)] += 1
+
+    def percentile(self, fraction):
+        """Оценка перцентиля сверху: граница корзины, в которую он попал"""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS_US[index] if index < len(LATENCY_BUCKETS_US) else round(self.max * 1e6, 1)
+        return 0
+
+    def snapshot(self):
+        labels = [f"<={bound}us" for bound in LATENCY_BUCKETS_US] + [f">{LATENCY_BUCKETS_US[-1]}us"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_us": round(self.total / self.count * 1e6, 1) if self.count else 0,
+            "max_us": round(self.max * 1e6, 1),
+            "p50_us": self.percentile(0.5),
+            "p95_us": self.percentile(0.95),
+            "p99_us": self.percentile(0.99),
+            "histogram": {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+class SalonMetrics:
+    """Счетчики и задержки операций салона. Включаются через BeautySalon.enable_metrics()"""
+
+    def __init__(self):
+        self.operations = {}  # {название операции: OperationStats}
+        self.rejections = {}  # {название исключения: сколько раз отказали в записи}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, operation, seconds):
+        with self._lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = OperationStats()
+            stats.add(seconds)
+
+    def reject(self, error):
+        name = type(error).__name__
+        with self._lock:
+            self.rejections[name] = self.rejections.get(name, 0) + 1
+
+    def timed(self, operation, func, *args):
+        """Вызывает func(*args) и учитывает время вызова как operation"""
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.observe(operation, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Возвращает текущие значения в виде словаря (его можно сразу сохранить в JSON)"""
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "operations": {name: stats.snapshot() for name, stats in sorted(self.operations.items())},
+                "rejections": dict(sorted(self.rejections.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+            self.rejections.clear()
+            self.started_at = time.time()
+
+
+def instrumented(operation):
+    """Декоратор метода салона: если метрики включены, учитывает время вызова как operation"""
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.observe(operation, time.perf_counter() - started)
+        return wrapper
+    return decorate
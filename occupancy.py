@@ -0,0 +1,123 @@
+from salon import WORKDAY_START, WORKDAY_END, date_to_ordinal, ordinal_to_date, minutes_to_time
+
+try:
+    import numpy as np
+except ImportError:  # без numpy календарь загрузки недоступен, остальное приложение работает
+    np = None
+
+HAS_NUMPY = np is not None
+
+# Значения ячеек матрицы загрузки
+FREE = 0
+SERVICE = 1
+BREAK = 2
+OFF = 3  # мастер не работает
+
+
+class OccupancyMatrix:
+    """Загрузка всех мастеров салона за период: массив uint8 (мастера x дни x слоты дня).
+
+    Ячейка - интервал длиной slot_minutes; она занята (SERVICE или BREAK), если с ней пересекается
+    запись или перерыв мастера. Услуга важнее перерыва, если обе попали в одну ячейку. Свободные ячейки
+    вне рабочих часов мастера помечаются OFF. По умолчанию столбцы охватывают от самого раннего начала
+    до самого позднего конца смен за период.
+    """
+
+    def __init__(self, salon, date_from, days=7, slot_minutes=5, day_start=None, day_end=None):
+        if np is None:
+            raise ImportError("Для матрицы загрузки нужен numpy: pip install numpy")
+        self.masters = list(salon.masters.values())
+        self.master_ids = [master.master_id for master in self.masters]
+        self.first_day = date_to_ordinal(date_from)
+        self.days = days
+        self.slot_minutes = slot_minutes
+        hours = [interval for master in self.masters for day_index in range(days)
+                 for interval in master.working_hours(self.first_day + day_index)]
+        if day_start is None:
+            day_start = min((start for start, _ in hours), default=WORKDAY_START)
+        if day_end is None:
+            day_end = max((end for _, end in hours), default=WORKDAY_END)
+        self.day_start = day_start
+        self.slots = max(-(-(day_end - day_start) // slot_minutes), 1)
+        self.cells = self._build()
+
+    def _build(self):
+        # Собираем все интервалы периода в плоские списки, дальше работаем только с массивами
+        rows, firsts, lasts, kinds = [], [], [], []
+        for master_index, master in enumerate(self.masters):
+            for day_index in range(self.days):
+                row = master_index * self.days + day_index
+                for start, end in master.working_hours(self.first_day + day_index):
+                    rows.append(row)
+                    firsts.append(start)
+                    lasts.append(end)
+                    kinds.append(FREE)
+                day_schedule = master.schedule.get(self.first_day + day_index)
+                if day_schedule is None:
+                    continue
+                for start, duration, record_type in list(day_schedule.records):
+                    rows.append(row)
+                    firsts.append(start)
+                    lasts.append(start + duration)
+                    kinds.append(SERVICE if record_type == "service" else BREAK)
+
+        shape = (len(self.masters) * self.days, self.slots)
+        cells = np.full(shape, OFF, dtype=np.uint8)
+        if rows:
+            rows = np.array(rows)
+            kinds = np.array(kinds, dtype=np.uint8)
+            # Номера первой и следующей за последней ячеек интервала, обрезанные границами дня
+            first = np.clip((np.array(firsts) - self.day_start) // self.slot_minutes, 0, self.slots)
+            last = np.clip(-(-(np.array(lasts) - self.day_start) // self.slot_minutes), 0, self.slots)
+            # Сначала рабочие часы (FREE), поверх - перерывы и услуги
+            for kind in (FREE, BREAK, SERVICE):
+                # Разностный массив: +1 в начале интервала, -1 после конца, накопленная сумма > 0 - занято
+                chosen = kinds == kind
+                delta = np.zeros((shape[0], shape[1] + 1), dtype=np.int32)
+                np.add.at(delta, (rows[chosen], first[chosen]), 1)
+                np.add.at(delta, (rows[chosen], last[chosen]), -1)
+                cells[np.cumsum(delta[:, :-1], axis=1) > 0] = kind
+        return cells.reshape(len(self.masters), self.days, self.slots)
+
+    def dates(self):
+        return [ordinal_to_date(self.first_day + day_index) for day_index in range(self.days)]
+
+    def slot_time(self, slot):
+        """Время начала ячейки в формате HH:MM"""
+        return minutes_to_time(self.day_start + slot * self.slot_minutes)
+
+    def busy(self):
+        """Булев массив ячеек, где записаться нельзя (услуги, перерывы, нерабочее время)"""
+        return self.cells != FREE
+
+    def _utilization(self, axis):
+        working = (self.cells != OFF).sum(axis=axis)
+        service = (self.cells == SERVICE).sum(axis=axis)
+        return np.divide(service, working, out=np.zeros(working.shape), where=working > 0)
+
+    def utilization_per_master(self):
+        """Доля рабочего времени периода, занятая услугами, для каждого мастера (в порядке master_ids)"""
+        return self._utilization((1, 2))
+
+    def utilization_per_day(self):
+        """Доля рабочего времени всех мастеров, занятая услугами, для каждого дня периода"""
+        return self._utilization((0, 2))
+
+    def first_free_run(self, minutes):
+        """Для каждой пары (мастер, день) - номер первой ячейки, с которой свободно minutes минут подряд, или -1"""
+        length = -(-minutes // self.slot_minutes)
+        if length > self.slots:
+            return np.full(self.cells.shape[:2], -1)
+        free = (self.cells == FREE).astype(np.int32)
+        # Сумма свободных ячеек в каждом окне длины length через накопленные суммы
+        totals = np.concatenate([np.zeros(self.cells.shape[:2] + (1,), dtype=np.int32), free.cumsum(axis=2)], axis=2)
+        runs = totals[:, :, length:] - totals[:, :, :-length] == length
+        return np.where(runs.any(axis=2), runs.argmax(axis=2), -1)
+
+    def to_photo_data(self, palette):
+        """Строка для tk.PhotoImage.put: строка изображения на пару (мастер, день), пиксель на ячейку.
+
+        palette - цвета для FREE, SERVICE, BREAK и OFF.
+        """
+        colors = np.array(palette)[self.cells.reshape(-1, self.slots)]
+        return " ".join("{" + " ".join(row) + "}" for row in colors.tolist())
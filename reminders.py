@@ -0,0 +1,198 @@
+from datetime import datetime
+import heapq
+import json
+import os
+import threading
+
+from salon import minutes_to_time, ordinal_to_date
+
+
+# За сколько минут до начала записи отправлять напоминания
+REMINDER_LEADS = (24 * 60, 2 * 60)
+# Сколько напоминаний в одном файле исходящих
+REMINDER_BATCH_SIZE = 500
+# Как часто поток рассылки просыпается, даже если ближайшее напоминание еще не скоро (секунды)
+REMINDER_MAX_SLEEP = 60
+
+
+def minute_key(day, minutes):
+    """Момент времени как число минут от начала номера дня 0"""
+    return day * 24 * 60 + minutes
+
+
+def now_key():
+    now = datetime.now()
+    return minute_key(now.toordinal(), now.hour * 60 + now.minute)
+
+
+class ReminderScheduler:
+    """Планировщик напоминаний о записях.
+
+    Напоминания лежат в куче по времени отправки (heapq); создание записи добавляет их,
+    а отмена или завершение только снимают запись с учета - ее напоминания выбрасываются,
+    когда дойдут до вершины кучи. Если таких накопилось больше половины, куча пересобирается.
+    Наступившие напоминания пишутся пачками в файлы JSON Lines каталога outbox: файл появляется
+    под именем *.jsonl целиком (через переименование), отправщик забирает и удаляет их сам.
+    """
+
+    def __init__(self, salon, outbox, leads=REMINDER_LEADS, batch_size=REMINDER_BATCH_SIZE, fsync=True):
+        self.salon = salon
+        self.outbox = outbox
+        self.leads = tuple(sorted(leads, reverse=True))
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.heap = []  # (время отправки, id записи, за сколько минут до начала)
+        self.pending = {}  # {id записи: [запись, сколько ее напоминаний в куче]}
+        self.stale = 0  # напоминаний в куче для снятых с учета записей
+        self.batches = 0  # номер последнего файла исходящих
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        os.makedirs(outbox, exist_ok=True)
+        salon.subscribe(self.on_change)
+        self._schedule_existing()
+
+    def _schedule_existing(self):
+        """Ставит в очередь напоминания о предстоящих записях, уже бывших в салоне до запуска"""
+        today = datetime.now().toordinal()
+        with self._condition:
+            for appointment in self.salon.iter_appointments(status="confirmed", date_from=ordinal_to_date(today)):
+                self._add(appointment, push=self.heap.append)
+            heapq.heapify(self.heap)
+
+    def on_change(self, event, appointment):
+        """Подписчик событий салона"""
+        with self._condition:
+            if event == "created" and appointment.status == "confirmed":
+                top = self.heap[0][0] if self.heap else None
+                self._add(appointment, push=lambda item: heapq.heappush(self.heap, item))
+                # Поток рассылки спит до прежнего ближайшего напоминания - будим, если появилось более раннее
+                if self.heap and (top is None or self.heap[0][0] < top):
+                    self._condition.notify()
+            elif appointment.status != "confirmed":
+                entry = self.pending.pop(appointment.appointment_id, None)
+                if entry is not None:
+                    self.stale += entry[1]
+                    if self.stale > len(self.heap) // 2:
+                        self._compact()
+
+    def _add(self, appointment, push):
+        if appointment.appointment_id in self.pending:
+            return
+        start = minute_key(appointment.day, appointment.start)
+        now = now_key()
+        # Напоминание, время которого уже прошло, не отправляем
+        items = [(start - lead, appointment.appointment_id, lead) for lead in self.leads if start - lead > now]
+        if items:
+            self.pending[appointment.appointment_id] = [appointment, len(items)]
+            for item in items:
+                push(item)
+
+    def _compact(self):
+        self.heap = [item for item in self.heap if item[1] in self.pending]
+        heapq.heapify(self.heap)
+        self.stale = 0
+
+    def next_due(self):
+        """Время отправки ближайшего напоминания (минуты, см. minute_key) или None"""
+        with self._condition:
+            while self.heap and self.heap[0][1] not in self.pending:
+                heapq.heappop(self.heap)
+                self.stale -= 1
+            return self.heap[0][0] if self.heap else None
+
+    def dispatch_due(self, now=None):
+        """Пишет в outbox все напоминания, время которых наступило; возвращает их количество"""
+        now = now_key() if now is None else now
+        due = []
+        with self._condition:
+            while self.heap and self.heap[0][0] <= now:
+                item = heapq.heappop(self.heap)
+                entry = self.pending.get(item[1])
+                if entry is None:
+                    self.stale -= 1
+                    continue
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.pending[item[1]]
+                due.append((item, entry[0]))
+
+        for start in range(0, len(due), self.batch_size):
+            batch = due[start:start + self.batch_size]
+            try:
+                self._write_batch([self._reminder(appointment, send_at, lead)
+                                   for (send_at, _, lead), appointment in batch])
+            except OSError:
+                # Неотправленные напоминания возвращаются в очередь до следующей попытки
+                with self._condition:
+                    for item, appointment in due[start:]:
+                        if appointment.status == "confirmed":
+                            entry = self.pending.setdefault(item[1], [appointment, 0])
+                            entry[1] += 1
+                            heapq.heappush(self.heap, item)
+                raise
+        return len(due)
+
+    @staticmethod
+    def _reminder(appointment, send_at, lead):
+        client = appointment.client
+        return {
+            "appointment_id": appointment.appointment_id,
+            "send_at": f"{ordinal_to_date(send_at // (24 * 60))} {minutes_to_time(send_at % (24 * 60))}",
+            "lead_minutes": lead,
+            "client": client.name,
+            "phone": client.phone,
+            "email": client.email,
+            "master": appointment.master.name,
+            "service": appointment.service.name,
+            "date": appointment.date,
+            "time_slot": appointment.time_slot,
+        }
+
+    def _write_batch(self, reminders):
+        self.batches += 1
+        name = f"reminders-{datetime.now():%Y%m%d-%H%M%S}-{self.batches:06d}"
+        tmp_path = os.path.join(self.outbox, name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(reminder, ensure_ascii=False) + "\n" for reminder in reminders))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.outbox, name + ".jsonl"))
+
+    def start(self):
+        """Запускает фоновый поток, который пишет напоминания, как только наступает их время"""
+        if self._thread is None:
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="salon-reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                due = self.next_due()
+                now = datetime.now()
+                timeout = REMINDER_MAX_SLEEP
+                if due is not None:
+                    # Напоминания отправляются с точностью до минуты
+                    timeout = min(timeout, max((due - now_key()) * 60 - now.second, 0))
+                if timeout:
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+            try:
+                self.dispatch_due()
+            except OSError:
+                # Каталог недоступен - повторим при следующем пробуждении
+                with self._condition:
+                    self._condition.wait(REMINDER_MAX_SLEEP)
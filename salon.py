@@ -1,27 +1,126 @@
+from bisect import bisect_left, insort
+from collections import deque
+from contextlib import ExitStack
 from datetime import datetime, timedelta
+import heapq
+from itertools import count, islice, permutations
 import re
-from exceptions import BeautySalonError, RoundMinuteError, TimeSlotNotAvailableError, ServiceNotProvidedError, ValidationError
+import threading
+from aggregates import FIELDS, SalonAggregates
+from appointment_index import AppointmentIndex
+from client_index import ClientIndex
+from metrics import SalonMetrics, instrumented
+from slot_cache import SlotCache
+from exceptions import (BeautySalonError, RoundMinuteError, TimeSlotNotAvailableError, OutsideWorkingHoursError,
+                        ServiceNotProvidedError, ValidationError)
+
+
+# Рабочий день с 9:00 до 21:00 (график мастера по умолчанию), слоты проверяются каждые 15 минут
+WORKDAY_START = 9 * 60
+WORKDAY_END = 21 * 60
+SLOT_STEP = 15
+DEFAULT_HOURS = ((WORKDAY_START, WORKDAY_END),)
+
+# Сколько последних изменений записей хранит лента изменений салона
+CHANGE_FEED_SIZE = 10000
+
+# Перенос записей мастера: на сколько дней вперед искать время и сколько раз повторять,
+# если расписание изменилось между подбором и применением переносов
+RESCHEDULE_DAYS_AHEAD = 7
+RESCHEDULE_ATTEMPTS = 3
+
+# Сколько списков свободного времени (мастер, день, длительность, шаг) держит кэш
+SLOT_CACHE_SIZE = 4096
+
+# Точка отсчета для интервалов, совпадает с datetime.strptime("00:00", "%H:%M")
+DAY_ORIGIN = datetime(1900, 1, 1)
+
+
+def time_to_minutes(time_str):
+    """Переводит время HH:MM в минуты от полуночи"""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_to_time(minutes):
+    """Переводит минуты от полуночи в строку HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def date_to_ordinal(date_str):
+    """Переводит дату YYYY-MM-DD в номер дня (как date.toordinal())"""
+    try:
+        return datetime.fromisoformat(date_str).toordinal()
+    except ValueError:
+        # strptime медленнее, но принимает и даты без ведущих нулей
+        return datetime.strptime(date_str, "%Y-%m-%d").toordinal()
+
+
+def ordinal_to_date(day):
+    """Переводит номер дня в строку YYYY-MM-DD"""
+    # isoformat заметно быстрее strftime, а выгрузки форматируют дату каждой записи
+    return datetime.fromordinal(day).isoformat()[:10]
+
+
+def iter_free_starts(records, day_start, day_end, duration, reserve, step):
+    """Перебирает начала свободных слотов за один проход по отсортированным занятым интервалам.
+
+    duration - длительность услуги, которая должна закончиться до конца рабочего дня,
+    reserve - сколько минут после начала не должно пересекаться с записями (услуга + перерыв).
+    Слоты выравниваются по сетке с шагом step от начала рабочего дня.
+    """
+    gap_start = day_start
+    last_start = day_end - duration
+    for booked_start, booked_duration, _ in records:
+        latest = booked_start - reserve
+        if latest >= last_start:
+            break
+        first = day_start + -(-(gap_start - day_start) // step) * step
+        yield from range(first, latest + 1, step)
+        gap_start = max(gap_start, booked_start + booked_duration)
+
+    first = day_start + -(-(gap_start - day_start) // step) * step
+    yield from range(first, last_start + 1, step)
+
+
+def compile_hours(intervals):
+    """Приводит рабочие интервалы [(начало, конец)] в минутах к шаблону: отсортированный кортеж
+    непересекающихся интервалов. Пустой шаблон - выходной."""
+    hours = []
+    for start, end in sorted(intervals):
+        if not 0 <= start < end <= 24 * 60:
+            raise ValidationError(f"Неверный рабочий интервал: {minutes_to_time(start)}-{minutes_to_time(end)}")
+        if hours and start <= hours[-1][1]:
+            hours[-1] = (hours[-1][0], max(hours[-1][1], end))
+        else:
+            hours.append((start, end))
+    return tuple(hours)
+
+
+def parse_hours(intervals):
+    """Переводит [("10:00", "14:00"), ...] в шаблон рабочих интервалов в минутах"""
+    for bounds in intervals:
+        for time_str in bounds:
+            TimeValidator.validate_time_format(time_str)
+    return compile_hours((time_to_minutes(start), time_to_minutes(end)) for start, end in intervals)
 
 
 class Client:
+    __slots__ = ("client_id", "name", "phone", "email")
+
     def __init__(self, client_id, name, phone, email=None):
         self.client_id = client_id
         self.name = name
         self.phone = phone
         self.email = email
-        self.visits_history = []
-
-    def add_visit(self, visit):
-        self.visits_history.append(visit)
-
-    def get_visit_history(self):
-        return self.visits_history
 
     def __str__(self):
         return f"Клиент: {self.name}, Телефон: {self.phone}"
 
 
 class Service:
+    __slots__ = ("service_id", "name", "duration", "price", "category")
+
     def __init__(self, service_id, name, duration, price, category):
         self.service_id = service_id
         self.name = name
@@ -33,59 +132,245 @@ class Service:
         return f"{self.name} - {self.duration} мин. - {self.price} руб."
 
 
+class DaySchedule:
+    """Отсортированный индекс занятых интервалов мастера на один день (время в минутах от полуночи)"""
+
+    __slots__ = ("starts", "records", "version")
+
+    def __init__(self):
+        self.starts = []  # начала интервалов по возрастанию
+        self.records = []  # (начало, длительность, тип_записи) в том же порядке
+        self.version = 0  # растет при каждом изменении, по нему проверяется кэш свободного времени
+
+    def is_free(self, start, end):
+        """Проверяет, что интервал [start, end) не пересекается с занятыми"""
+        # Интервалы не пересекаются, поэтому достаточно проверить ближайший слева от end
+        index = bisect_left(self.starts, end)
+        if index == 0:
+            return True
+        booked_start, booked_duration, _ = self.records[index - 1]
+        return booked_start + booked_duration <= start
+
+    def add(self, start, duration, record_type):
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.records.insert(index, (start, duration, record_type))
+        self.version += 1
+
+    def remove(self, start, record_type):
+        """Удаляет интервал, начинающийся в start, если он указанного типа"""
+        index = bisect_left(self.starts, start)
+        if index < len(self.starts) and self.starts[index] == start and self.records[index][2] == record_type:
+            del self.starts[index]
+            del self.records[index]
+            self.version += 1
+            return True
+        return False
+
+    def merge(self, records):
+        """Добавляет отсортированные интервалы, не пересекающиеся с текущими, одним слиянием"""
+        self.records = list(heapq.merge(self.records, records))
+        self.starts = [record[0] for record in self.records]
+        self.version += 1
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+
+class DayLock:
+    """Блокировка расписания мастера на один день (реентерабельная) со счетчиком входов"""
+
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0  # сколько раз в нее вошли и еще не вышли; меняется только владельцем
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        self.lock.release()
+
+    def if_idle(self, action):
+        """Выполняет action() под блокировкой, если ее сейчас никто не держит, в том числе текущий поток.
+
+        Возвращает, выполнено ли действие."""
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.depth:
+                return False
+            action()
+            return True
+        finally:
+            self.lock.release()
+
+
 class Master:
+    """Мастер салона. Дни в расписании - номера дней (date.toordinal()), время - минуты от полуночи;
+    строки дат и времени разбирает BeautySalon"""
+
+    __slots__ = ("master_id", "name", "specialization", "phone", "schedule", "break_duration", "day_locks",
+                 "week_hours", "day_hours", "hours_version", "_minutes_table")
+
     def __init__(self, master_id, name, specialization, phone, break_duration=10):
         self.master_id = master_id
         self.name = name
         self.specialization = specialization
         self.phone = phone
-        self.schedule = {}  # {дата: {время: (длительность, тип_записи)}}
+        self.schedule = {}  # {номер дня: DaySchedule}; хранилище в базе заменяет его на ScheduleDays
         self.break_duration = break_duration
-
-    def is_available(self, date, time, duration):
-        """Проверяет доступность мастера с учетом конкретной длительности услуги"""
-        if date not in self.schedule:
+        self.day_locks = {}  # {номер дня: блокировка расписания на этот день}
+        # Рабочие часы - готовые шаблоны (см. compile_hours), пересобираются только при изменении графика
+        self.week_hours = [DEFAULT_HOURS] * 7  # по дням недели, 0 - понедельник
+        self.day_hours = {}  # {номер дня: шаблон} - исключения: выходные, сокращенные дни
+        self.hours_version = 0  # растет при изменении графика, по нему проверяется кэш свободного времени
+        self._minutes_table = None  # префиксные суммы рабочих минут для working_minutes
+
+    def working_hours(self, day):
+        """Шаблон рабочих интервалов на день: исключение на эту дату или обычный график дня недели"""
+        hours = self.day_hours.get(day)
+        if hours is not None:
+            return hours
+        # Номер дня 1 (01.01.0001) - понедельник
+        return self.week_hours[(day - 1) % 7]
+
+    def working_minutes(self, day_from, day_to):
+        """Сумма рабочих минут за дни [day_from, day_to] по префиксным суммам графика"""
+        if day_from > day_to:
+            return 0
+        return self._minutes_before(day_to + 1) - self._minutes_before(day_from)
+
+    def _minutes_before(self, day):
+        """Рабочие минуты за все дни с номерами меньше day"""
+        table = self._minutes_table
+        if table is None or table[0] != self.hours_version:
+            table = self._minutes_table = self._build_minutes_table()
+        _, week_prefix, exception_days, exception_prefix = table
+        # Дни 1..day-1 - это полные недели и остаток, который начинается с понедельника
+        weeks, rest = divmod(day - 1, 7)
+        return weeks * week_prefix[7] + week_prefix[rest] + exception_prefix[bisect_left(exception_days, day)]
+
+    def _build_minutes_table(self):
+        """(версия графика, префиксные суммы недели, дни-исключения по порядку, префиксные суммы их поправок)"""
+        version = self.hours_version
+
+        def minutes(hours):
+            return sum(end - start for start, end in hours)
+
+        week_prefix = [0]
+        for hours in self.week_hours:
+            week_prefix.append(week_prefix[-1] + minutes(hours))
+        exception_days = sorted(self.day_hours)
+        exception_prefix = [0]
+        for day in exception_days:
+            exception_prefix.append(exception_prefix[-1] + minutes(self.day_hours[day])
+                                    - minutes(self.week_hours[(day - 1) % 7]))
+        return version, week_prefix, exception_days, exception_prefix
+
+    def set_week_hours(self, weekday, hours):
+        self.week_hours[weekday] = compile_hours(hours)
+        self.hours_version += 1
+
+    def set_day_hours(self, day, hours):
+        """Задает исключение на день; hours=None возвращает обычный график"""
+        if hours is None:
+            self.day_hours.pop(day, None)
+        else:
+            self.day_hours[day] = compile_hours(hours)
+        self.hours_version += 1
+
+    def is_working(self, day, start, duration):
+        """Проверяет, что услуга целиком попадает в один из рабочих интервалов дня"""
+        for open_start, open_end in self.working_hours(day):
+            if open_start <= start and start + duration <= open_end:
+                return True
+        return False
+
+    def day_lock(self, day):
+        """Блокировка расписания мастера на день: под ней проверяют и меняют записи этого дня"""
+        lock = self.day_locks.get(day)
+        if lock is None:
+            # setdefault атомарен, поэтому два потока получат одну и ту же блокировку
+            lock = self.day_locks.setdefault(day, DayLock())
+        return lock
+
+    def is_available(self, day, start, duration):
+        """Проверяет доступность мастера с учетом рабочих часов, длительности услуги и перерыва после нее"""
+        if not self.is_working(day, start, duration):
+            return False
+        day_schedule = self.schedule.get(day)
+        if day_schedule is None:
             return True
+        return day_schedule.is_free(start, start + duration + self.break_duration)
 
-        new_start = datetime.strptime(time, "%H:%M")
-        new_end = new_start + timedelta(minutes=duration)
-
-        # Проверяем все существующие записи на эту дату
-        for booked_time, (booked_duration, _) in self.schedule[date].items():
-            booked_start = datetime.strptime(booked_time, "%H:%M")
-            booked_end = booked_start + timedelta(minutes=booked_duration)
-
-            # Проверяем пересечение интервалов
-            if not (new_end <= booked_start or new_start >= booked_end):
-                return False
-
-        return True
-
-    def add_appointment(self, date, time, duration):
-        """Добавляет запись с указанием длительности"""
-        if date not in self.schedule:
-            self.schedule[date] = {}
+    def add_appointment(self, day, start, duration):
+        """Добавляет запись с указанием длительности (вызывающий держит day_lock(day))"""
+        day_schedule = self.schedule.get(day)
+        if day_schedule is None:
+            day_schedule = self.schedule[day] = DaySchedule()
 
         # Добавляем основную запись
-        self.schedule[date][time] = (duration, "service")
+        day_schedule.add(start, duration, "service")
 
         # Добавляем перерыв после услуги
-        start_time = datetime.strptime(time, "%H:%M")
-        break_time = start_time + timedelta(minutes=duration)
-        break_time_str = break_time.strftime("%H:%M")
-        self.schedule[date][break_time_str] = (self.break_duration, "break")
-
-        # Сортируем расписание для удобства
-        self.schedule[date] = dict(sorted(self.schedule[date].items()))
-
-    def get_busy_intervals(self, date):
-        """Возвращает список занятых интервалов на указанную дату"""
-        if date not in self.schedule:
+        if self.break_duration:
+            day_schedule.add(start + duration, self.break_duration, "break")
+
+    def remove_appointment(self, day, start, duration):
+        """Освобождает время записи и перерыв после нее (вызывающий держит day_lock(day))"""
+        day_schedule = self.schedule.get(day)
+        if day_schedule is not None:
+            day_schedule.remove(start, "service")
+            day_schedule.remove(start + duration, "break")
+
+    def add_appointments(self, day, blocks):
+        """Добавляет сразу несколько записей: blocks - отсортированные свободные (начало в минутах, длительность)"""
+        records = []
+        for start, duration in blocks:
+            records.append((start, duration, "service"))
+            if self.break_duration:
+                records.append((start + duration, self.break_duration, "break"))
+
+        day_schedule = self.schedule.get(day)
+        if day_schedule is None:
+            day_schedule = self.schedule[day] = DaySchedule()
+        day_schedule.merge(records)
+
+    def schedule_version(self, day):
+        """Версия расписания на день: меняется при каждой записи, отмене и изменении графика"""
+        day_schedule = self.schedule.get(day)
+        return self.hours_version, day_schedule.version if day_schedule is not None else 0
+
+    def iter_free_slots(self, day, duration, step=SLOT_STEP, records=None):
+        """Лениво перебирает свободные начала (в минутах) для услуги указанной длительности.
+
+        Рабочие интервалы дня пересекаются с занятыми; сетка слотов идет от начала каждого интервала.
+        records - другие занятые интервалы вместо текущего расписания (например, черновик переноса).
+        """
+        if records is None:
+            day_schedule = self.schedule.get(day)
+            records = day_schedule.records if day_schedule is not None else ()
+        reserve = duration + self.break_duration
+        for open_start, open_end in self.working_hours(day):
+            yield from iter_free_starts(records, open_start, open_end, duration, reserve, step)
+
+    def get_busy_intervals(self, day):
+        """Возвращает список занятых интервалов на указанный день"""
+        day_schedule = self.schedule.get(day)
+        if day_schedule is None:
             return []
 
         busy_intervals = []
-        for time, (duration, record_type) in sorted(self.schedule[date].items()):
-            start_time = datetime.strptime(time, "%H:%M")
+        for start, duration, record_type in day_schedule:
+            start_time = DAY_ORIGIN + timedelta(minutes=start)
             end_time = start_time + timedelta(minutes=duration)
             busy_intervals.append((start_time, end_time, record_type))
         return busy_intervals
@@ -95,34 +380,50 @@ class Master:
 
 
 class Appointment:
-    def __init__(self, appointment_id, client, master, service, date, time_slot):
+    """Запись клиента: day - номер дня, start - начало в минутах от полуночи"""
+
+    __slots__ = ("appointment_id", "client", "master", "service", "day", "start", "status", "listener")
+
+    def __init__(self, appointment_id, client, master, service, day, start):
         self.appointment_id = appointment_id
         self.client = client
         self.master = master
         self.service = service
-        self.date = date
-        self.time_slot = time_slot
+        self.day = day
+        self.start = start
         self.status = "confirmed"
+        self.listener = None  # вызывается при смене статуса: listener(событие, запись)
+
+    @property
+    def date(self):
+        return ordinal_to_date(self.day)
 
-    def cancel(self):
-        self.status = "cancelled"
-        # Освобождаем время у мастера
-        date_schedule = self.master.schedule.get(self.date, {})
+    @property
+    def time_slot(self):
+        return minutes_to_time(self.start)
 
-        # Удаляем основную запись
-        if self.time_slot in date_schedule:
-            del date_schedule[self.time_slot]
+    def cancel(self, notify=True):
+        """Отменяет запись и освобождает время мастера; возвращает False, если запись уже отменена.
 
-        # Удаляем перерыв после услуги
-        start_time = datetime.strptime(self.time_slot, "%H:%M")
-        break_time = start_time + timedelta(minutes=self.service.duration)
-        break_time_str = break_time.strftime("%H:%M")
+        notify=False - подписчиков оповестит вызывающий код (когда отпустит свои блокировки)"""
+        with self.master.day_lock(self.day):
+            if self.status == "cancelled":
+                return False
+            self.status = "cancelled"
+            # Освобождаем время у мастера: основную запись и перерыв после услуги
+            self.master.remove_appointment(self.day, self.start, self.service.duration)
 
-        if break_time_str in date_schedule:
-            del date_schedule[break_time_str]
+        # Подписчиков оповещаем уже без блокировки: они могут сами создавать записи
+        if notify and self.listener is not None:
+            self.listener("cancelled", self)
+        return True
 
     def complete(self):
-        self.status = "completed"
+        """Отмечает запись выполненной; салон сохраняет смену статуса через listener"""
+        with self.master.day_lock(self.day):
+            self.status = "completed"
+        if self.listener is not None:
+            self.listener("completed", self)
 
     def __str__(self):
         return f"Запись #{self.appointment_id}: {self.client.name} -> {self.master.name} ({self.service.name}) {self.date} {self.time_slot}"
@@ -146,10 +447,14 @@ class TimeValidator:
         return True
 
     @staticmethod
-    def validate_future_date(date_str):
+    def validate_future_date(date_str, today=None):
         """Проверяет, что дата не в прошлом"""
-        appointment_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        if appointment_date < datetime.now().date():
+        return TimeValidator.validate_future_day(date_to_ordinal(date_str), today)
+
+    @staticmethod
+    def validate_future_day(day, today=None):
+        """Проверяет, что день (номер дня) не в прошлом; today - номер сегодняшнего дня"""
+        if day < (today or datetime.now().toordinal()):
             raise ValidationError("Нельзя записаться на прошедшую дату")
         return True
 
@@ -161,36 +466,214 @@ class BeautySalon:
         self.services = {}
         self.masters = {}
         self.appointments = {}
+        self.service_masters = {}  # {название услуги: {id мастера: Master}}
+        self.client_index = ClientIndex(self.clients)
         self.next_client_id = 1
         self.next_service_id = 1
         self.next_master_id = 1
         self.next_appointment_id = 1
         self.validator = TimeValidator()
+        self.storage = None  # журнал или база, куда записываются изменения (см. journal.py)
+        # История записей клиентов и выборки по мастеру, датам и статусу (см. query_appointments)
+        self.appointment_index = AppointmentIndex()
+        self.aggregates = SalonAggregates()  # выручка, минуты и отмены по дням (см. get_report)
+        self.listeners = [self.appointment_index.on_change, self.aggregates.on_change]  # подписчики на изменения записей
+        self.change_seq = 0  # номер последнего изменения записей
+        self.changes = deque(maxlen=CHANGE_FEED_SIZE)  # лента изменений: (номер, id записи)
+        self.metrics = None  # SalonMetrics, если включены замеры (см. enable_metrics)
+        self.slot_cache = SlotCache(SLOT_CACHE_SIZE)  # свободное время по версиям дней мастеров
+        # Записи на разных мастеров и даты не ждут друг друга: их защищают блокировки Master.day_lock,
+        # а эти две блокировки держатся недолго и только вокруг общих счетчиков и справочников
+        self._ids_lock = threading.Lock()  # номера записей и лента изменений
+        self._registry_lock = threading.Lock()  # добавление клиентов, услуг и мастеров
+
+    def enable_metrics(self):
+        """Включает счетчики и замеры времени операций; без них операции ничего не замеряют"""
+        if self.metrics is None:
+            self.metrics = SalonMetrics()
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def get_metrics(self):
+        """Снимок метрик в виде словаря или None, если метрики выключены"""
+        return self.metrics.snapshot() if self.metrics is not None else None
+
+    def _reject(self, error):
+        if self.metrics is not None:
+            self.metrics.reject(error)
+
+    def subscribe(self, callback):
+        """Подписывает callback(событие, запись) на создание, отмену и завершение записей"""
+        self.listeners.append(callback)
+
+    def get_changes(self, since):
+        """Возвращает (номер последнего изменения, id записей, измененных после since).
+
+        Если лента уже не содержит изменений после since, вместо списка id возвращается None:
+        подписчику нужно перечитать записи целиком.
+        """
+        if since >= self.change_seq:
+            return self.change_seq, []
+        if not self.changes or self.changes[0][0] > since + 1:
+            return self.change_seq, None
+        # Номера в ленте идут подряд, поэтому нужный хвост находится по смещению
+        offset = since + 1 - self.changes[0][0]
+        return self.change_seq, [self.changes[i][1] for i in range(offset, len(self.changes))]
+
+    def _publish(self, event, appointment):
+        with self._ids_lock:
+            self.change_seq += 1
+            self.changes.append((self.change_seq, appointment.appointment_id))
+        for callback in self.listeners:
+            callback(event, appointment)
 
     def add_client(self, name, phone, email=None):
-        client = Client(self.next_client_id, name, phone, email)
-        self.clients[self.next_client_id] = client
-        self.next_client_id += 1
+        with self._registry_lock:
+            existing = self.find_client_by_phone(phone)
+            if existing:
+                raise ValidationError(f"Клиент с телефоном {phone} уже есть: {existing.name}")
+
+            client = Client(self.next_client_id, name, phone, email)
+            self._save("record_client", self._register_client, client)
         return client
 
     def add_service(self, name, duration, price, category):
-        service = Service(self.next_service_id, name, duration, price, category)
-        self.services[self.next_service_id] = service
-        self.next_service_id += 1
+        with self._registry_lock:
+            service = Service(self.next_service_id, name, duration, price, category)
+            self._save("record_service", self._register_service, service)
         return service
 
     def add_master(self, name, specialization, phone, break_duration=10):
-        master = Master(self.next_master_id, name, specialization, phone, break_duration)
-        self.masters[self.next_master_id] = master
-        self.next_master_id += 1
+        with self._registry_lock:
+            master = Master(self.next_master_id, name, specialization, phone, break_duration)
+            self._save("record_master", self._register_master, master)
         return master
 
+    def set_master_hours(self, master_id, weekday, intervals):
+        """Задает обычный график мастера на день недели (0 - понедельник, 6 - воскресенье).
+
+        intervals - [("10:00", "14:00"), ("15:00", "21:00")]: промежуток между интервалами - обед,
+        пустой список - выходной. Уже созданные записи не переносятся.
+        """
+        if weekday not in range(7):
+            raise ValidationError("День недели должен быть от 0 (понедельник) до 6 (воскресенье)")
+        self._set_hours(master_id, weekday, None, intervals)
+
+    def set_master_day_hours(self, master_id, date, intervals):
+        """Задает график мастера на конкретную дату (выходной, другая смена); intervals=None - обычный график"""
+        self._set_hours(master_id, None, date_to_ordinal(date), intervals)
+
+    def _set_hours(self, master_id, weekday, day, intervals):
+        if master_id not in self.masters:
+            raise ValidationError("Мастер не найден")
+        hours = parse_hours(intervals) if intervals is not None else None
+        self._save("record_hours", self._register_hours, (master_id, weekday, day, hours))
+
+    def _save(self, record, register, item):
+        """Сохраняет изменение в хранилище и вносит его в салон.
+
+        Обе операции выполняются под блокировкой хранилища: изменение попадает в журнал раньше,
+        чем его увидят другие потоки, а снимок состояния содержит все уже записанные изменения.
+        """
+        storage = self.storage
+        if storage is None:
+            register(item)
+            return
+        with storage.lock:
+            getattr(storage, record)(item)
+            register(item)
+
+    def _register_client(self, client):
+        self.clients[client.client_id] = client
+        self.client_index.add(client)
+        self.next_client_id = max(self.next_client_id, client.client_id + 1)
+
+    def find_client_by_phone(self, phone):
+        """Ищет клиента по телефону в любом формате записи"""
+        find_client_id = getattr(self.storage, "find_client_id", None)
+        if find_client_id is not None:
+            # Хранилище в базе ищет по своему индексу телефонов
+            return self.clients.get(find_client_id(phone))
+        return self.client_index.find_by_phone(phone)
+
+    def find_clients_by_email(self, email):
+        return self.client_index.find_by_email(email)
+
+    def search_clients(self, query, limit=20):
+        """Ищет клиентов по email, телефону или началу имени/фамилии"""
+        query = query.strip()
+        if '@' in query:
+            return self.find_clients_by_email(query)[:limit]
+        if query and not any(ch.isalpha() for ch in query):
+            client = self.find_client_by_phone(query)
+            return [client] if client else []
+        return self.client_index.search_name(query, limit)
+
+    def _register_service(self, service):
+        self.services[service.service_id] = service
+        self.service_masters.setdefault(service.name, {})
+        self.next_service_id = max(self.next_service_id, service.service_id + 1)
+
+    def _register_master(self, master):
+        self.masters[master.master_id] = master
+        for service_name in master.specialization:
+            self.service_masters.setdefault(service_name, {})[master.master_id] = master
+        self.next_master_id = max(self.next_master_id, master.master_id + 1)
+
+    def _register_hours(self, item):
+        """item - (id мастера, день недели или None, номер дня или None, шаблон часов или None)"""
+        master_id, weekday, day, hours = item
+        master = self.masters[master_id]
+        if weekday is not None:
+            master.set_week_hours(weekday, hours)
+        else:
+            master.set_day_hours(day, hours)
+
+    def _register_appointment(self, appointment, book=True):
+        """Вносит запись в салон; время у мастера занимается только для действующих записей,
+        book=False - время уже занято вызывающим кодом"""
+        if book and appointment.status != "cancelled":
+            master = appointment.master
+            with master.day_lock(appointment.day):
+                master.add_appointment(appointment.day, appointment.start, appointment.service.duration)
+        with self._ids_lock:
+            self.next_appointment_id = max(self.next_appointment_id, appointment.appointment_id + 1)
+        self.appointments[appointment.appointment_id] = appointment
+        appointment.listener = self._appointment_changed
+        self._publish("created", appointment)
+
+    def _appointment_changed(self, event, appointment):
+        """Слушатель записи: сохраняет статус, измененный прямо через Appointment, и оповещает подписчиков"""
+        if self.storage is not None:
+            self.storage.record_status(appointment)
+        self._publish(event, appointment)
+
+    def _allocate_appointment_ids(self, count=1):
+        """Атомарно выдает count номеров записей подряд, возвращает первый"""
+        with self._ids_lock:
+            first_id = self.next_appointment_id
+            self.next_appointment_id += count
+        return first_id
+
+    def get_masters_for_service(self, service_id):
+        """Возвращает мастеров, которые выполняют указанную услугу"""
+        service = self.services.get(service_id)
+        if not service:
+            return []
+        return list(self.service_masters.get(service.name, {}).values())
+
+    @instrumented("create_appointment")
     def create_appointment(self, client_id, master_id, service_id, date, time_slot):
         try:
             # Валидация времени
             self.validator.validate_time_format(time_slot)
             self.validator.validate_round_minutes(time_slot)
-            self.validator.validate_future_date(date)
+            # Дата и время разбираются один раз, дальше работаем с номером дня и минутами
+            day = date_to_ordinal(date)
+            self.validator.validate_future_day(day)
+            start = time_to_minutes(time_slot)
 
             client = self.clients.get(client_id)
             master = self.masters.get(master_id)
@@ -199,73 +682,609 @@ class BeautySalon:
             if not all([client, master, service]):
                 return None, "Не найдены клиент, мастер или услуга."
 
-            if service.name not in master.specialization:
+            if master_id not in self.service_masters.get(service.name, {}):
                 raise ServiceNotProvidedError(master.name, service.name)
 
-            # Проверяем доступность с учетом КОНКРЕТНОЙ ДЛИТЕЛЬНОСТИ услуги
-            if not master.is_available(date, time_slot, service.duration):
-                raise TimeSlotNotAvailableError(time_slot, date)
-
-            appointment = Appointment(self.next_appointment_id, client, master, service, date, time_slot)
-            self.appointments[self.next_appointment_id] = appointment
-            master.add_appointment(date, time_slot, service.duration)  # передаем длительность!
-            client.add_visit(appointment)
+            if not master.is_working(day, start, service.duration):
+                raise OutsideWorkingHoursError(time_slot)
 
-            self.next_appointment_id += 1
+            # Проверка и бронирование под блокировкой дня мастера, чтобы два потока не заняли одно время
+            with master.day_lock(day):
+                # Проверяем доступность с учетом КОНКРЕТНОЙ ДЛИТЕЛЬНОСТИ услуги
+                if self.metrics is None:
+                    available = master.is_available(day, start, service.duration)
+                else:
+                    available = self.metrics.timed("is_available", master.is_available, day, start, service.duration)
+                if not available:
+                    raise TimeSlotNotAvailableError(time_slot)
+                master.add_appointment(day, start, service.duration)
+
+                # Запись сохраняется, пока день заблокирован: расписание дня в памяти не расходится с базой
+                appointment = Appointment(self._allocate_appointment_ids(), client, master, service, day, start)
+                try:
+                    self._save("record_appointment", self._register_booked, appointment)
+                except Exception:
+                    # Хранилище не приняло запись - время не должно остаться занятым без записи
+                    master.remove_appointment(day, start, service.duration)
+                    raise
             return appointment, "Запись создана успешно"
 
         except BeautySalonError as e:
+            self._reject(e)
             return None, str(e)
 
+    def create_appointments_batch(self, requests):
+        """Создает много записей за раз.
+
+        requests - последовательность (client_id, master_id, service_id, date, time_slot).
+        Запросы группируются по (мастер, дата), каждая группа сортируется один раз и проверяется
+        на пересечения одним проходом вместе с уже существующими записями. При конфликте внутри
+        пачки остается запись с более ранним временем. Возвращает список (запись или None, сообщение)
+        в порядке запросов.
+        """
+        results = [None] * len(requests)
+        today = datetime.now().toordinal()
+        checked_slots = {}  # (дата, время) -> (номер дня, минуты) или ошибка валидации
+        groups = {}  # (id мастера, номер дня) -> [(начало, номер запроса, клиент, услуга)]
+
+        for index, (client_id, master_id, service_id, date, time_slot) in enumerate(requests):
+            slot = checked_slots.get((date, time_slot))
+            if slot is None:
+                slot = checked_slots[(date, time_slot)] = self._check_slot(date, time_slot, today)
+            if isinstance(slot, BeautySalonError):
+                self._reject(slot)
+                results[index] = (None, str(slot))
+                continue
+
+            client = self.clients.get(client_id)
+            master = self.masters.get(master_id)
+            service = self.services.get(service_id)
+            if not all([client, master, service]):
+                results[index] = (None, "Не найдены клиент, мастер или услуга.")
+                continue
+            if master_id not in self.service_masters.get(service.name, {}):
+                error = ServiceNotProvidedError(master.name, service.name)
+                self._reject(error)
+                results[index] = (None, str(error))
+                continue
+
+            day, start = slot
+            groups.setdefault((master_id, day), []).append((start, index, client, service))
+
+        accepted = []
+        with ExitStack() as stack:
+            # Дни держатся заблокированными до сохранения пачки, чтобы расписание в памяти не расходилось
+            # с хранилищем; блокировки берутся в одном порядке, как при переносе записей
+            for master_id, day in sorted(groups):
+                stack.enter_context(self.masters[master_id].day_lock(day))
+
+            for (master_id, day), items in groups.items():
+                master = self.masters[master_id]
+                items.sort(key=lambda item: item[:2])
+                day_schedule = master.schedule.get(day)
+                records = day_schedule.records if day_schedule is not None else []
+                position = 0  # первая существующая запись, которая заканчивается позже текущего начала
+                free_from = 0  # конец последней принятой записи из пачки
+                blocks = []
+
+                for start, index, client, service in items:
+                    end = start + service.duration + master.break_duration
+                    while position < len(records) and records[position][0] + records[position][1] <= start:
+                        position += 1
+                    if not master.is_working(day, start, service.duration):
+                        error = OutsideWorkingHoursError(requests[index][4])
+                        self._reject(error)
+                        results[index] = (None, str(error))
+                        continue
+                    if start < free_from or (position < len(records) and records[position][0] < end):
+                        error = TimeSlotNotAvailableError(requests[index][4])
+                        self._reject(error)
+                        results[index] = (None, str(error))
+                        continue
+                    free_from = end
+                    blocks.append((start, service.duration))
+                    accepted.append((index, client, master, service, day, start))
+
+                if blocks:
+                    master.add_appointments(day, blocks)
+
+            # Номера записей выдаются в порядке запросов
+            accepted.sort(key=lambda item: item[0])
+            created = []
+            appointment_id = self._allocate_appointment_ids(len(accepted))
+            for index, client, master, service, day, start in accepted:
+                created.append(Appointment(appointment_id, client, master, service, day, start))
+                results[index] = (created[-1], "Запись создана успешно")
+                appointment_id += 1
+
+            if created:
+                try:
+                    self._save("record_appointments", self._register_booked_batch, created)
+                except Exception:
+                    # Хранилище не приняло пачку - освобождаем все занятое под нее время
+                    for appointment in created:
+                        appointment.master.remove_appointment(appointment.day, appointment.start,
+                                                              appointment.service.duration)
+                    raise
+        return results
+
+    def import_history(self, records):
+        """Вносит записи из выгрузки как есть - с их датой и статусом, без проверок бронирования
+        (прошедшая дата, рабочие часы, кратность минут).
+
+        records - последовательность (client_id, master_id, service_id, date, time_slot, status).
+        Время мастера занимают только неотмененные записи, и оно не должно пересекаться с уже занятым.
+        Номера записям назначает салон. Возвращает список (запись или None, сообщение) в порядке records.
+        """
+        results = [None] * len(records)
+        accepted = []  # (номер запроса, клиент, мастер, услуга, день, начало, статус)
+        for index, (client_id, master_id, service_id, date, time_slot, status) in enumerate(records):
+            try:
+                self.validator.validate_time_format(time_slot)
+                try:
+                    day = date_to_ordinal(date)
+                except ValueError:
+                    raise ValidationError(f"Неверная дата: {date}. Используйте YYYY-MM-DD")
+                if status not in ("confirmed", "completed", "cancelled"):
+                    raise ValidationError(f"Неизвестный статус записи: {status}")
+            except BeautySalonError as e:
+                results[index] = (None, str(e))
+                continue
+            client = self.clients.get(client_id)
+            master = self.masters.get(master_id)
+            service = self.services.get(service_id)
+            if not all([client, master, service]):
+                results[index] = (None, "Не найдены клиент, мастер или услуга.")
+                continue
+            accepted.append((index, client, master, service, day, time_to_minutes(time_slot), status))
+
+        created, booked = [], []
+        with ExitStack() as stack:
+            for master_id, day in sorted({(item[2].master_id, item[4]) for item in accepted if item[6] != "cancelled"}):
+                stack.enter_context(self.masters[master_id].day_lock(day))
+
+            for index, client, master, service, day, start, status in accepted:
+                if status != "cancelled":
+                    day_schedule = master.schedule.get(day)
+                    if day_schedule is not None and not day_schedule.is_free(
+                            start, start + service.duration + master.break_duration):
+                        results[index] = (None, str(TimeSlotNotAvailableError(minutes_to_time(start))))
+                        continue
+                    master.add_appointment(day, start, service.duration)
+                    booked.append((master, day, start, service.duration))
+                appointment = Appointment(None, client, master, service, day, start)
+                appointment.status = status
+                created.append(appointment)
+                results[index] = (appointment, "Запись загружена")
+
+            if not created:
+                return results
+            appointment_id = self._allocate_appointment_ids(len(created))
+            for offset, appointment in enumerate(created):
+                appointment.appointment_id = appointment_id + offset
+            try:
+                self._save("record_appointments", self._register_booked_batch, created)
+            except Exception:
+                for booked_master, booked_day, booked_start, booked_duration in booked:
+                    booked_master.remove_appointment(booked_day, booked_start, booked_duration)
+                raise
+            # Журнал пишет запись как подтвержденную, другой статус сохраняется отдельно
+            if self.storage is not None:
+                for appointment in created:
+                    if appointment.status != "confirmed":
+                        self.storage.record_status(appointment)
+        return results
+
+    def _register_booked(self, appointment):
+        self._register_appointment(appointment, book=False)
+
+    def _register_booked_batch(self, appointments):
+        for appointment in appointments:
+            self._register_appointment(appointment, book=False)
+
+    def _check_slot(self, date, time_slot, today):
+        """Проверяет время и дату записи, возвращает (номер дня, начало в минутах) или ошибку"""
+        try:
+            self.validator.validate_time_format(time_slot)
+            self.validator.validate_round_minutes(time_slot)
+            try:
+                day = date_to_ordinal(date)
+            except ValueError:
+                # Несуществующая дата (2026-02-30) - ошибка одного запроса, а не всей пачки
+                raise ValidationError(f"Неверная дата: {date}. Используйте YYYY-MM-DD")
+            self.validator.validate_future_day(day, today)
+        except BeautySalonError as e:
+            return e
+        return day, time_to_minutes(time_slot)
+
+    @instrumented("cancel_appointment")
     def cancel_appointment(self, appointment_id):
         appointment = self.appointments.get(appointment_id)
         if appointment:
-            appointment.cancel()
+            # Подписчики (например, лист ожидания) могут сразу занять освободившееся время,
+            # поэтому отмена сохраняется до оповещения - еще под блокировкой дня, как и создание записи
+            with appointment.master.day_lock(appointment.day):
+                cancelled = appointment.cancel(notify=False)
+                if cancelled and self.storage is not None:
+                    self.storage.record_status(appointment)
+            if cancelled:
+                self._publish("cancelled", appointment)
             return True, "Запись отменена"
         return False, "Запись не найдена"
 
+    def reschedule_master(self, master_id, date_from, date_to, days_ahead=RESCHEDULE_DAYS_AHEAD, step=SLOT_STEP):
+        """Переносит подтвержденные записи мастера с date_from по date_to (например, на время болезни).
+
+        Запись по возможности остается в тот же день у другого мастера с этой услугой, на ближайшее
+        к прежнему время; иначе уходит на первый из следующих days_ahead дней, где есть место
+        (вне этих дат подходит и сам мастер). Все переносы применяются разом под блокировками
+        затронутых дней, и в том же шаге оставшиеся дни периода становятся у мастера выходными
+        (вернуть график - set_master_day_hours(..., None)), чтобы на освободившееся время никто
+        не записался. Возвращает {"moved": [(старая запись, новая запись)],
+        "unresolved": [записи, которые некуда перенести - они остаются без изменений]}.
+        """
+        master = self.masters.get(master_id)
+        if not master:
+            raise ValidationError("Мастер не найден")
+        first_day, last_day = date_to_ordinal(date_from), date_to_ordinal(date_to)
+
+        for _ in range(RESCHEDULE_ATTEMPTS):
+            now = datetime.now()
+            today, now_minutes = now.toordinal(), now.hour * 60 + now.minute
+            # Уже прошедшие записи остаются в истории как есть
+            affected = [
+                appointment for appointment in self.query_appointments(
+                    master_id=master_id, status="confirmed", date_from=date_from, date_to=date_to, limit=None)
+                if (appointment.day, appointment.start) >= (today, now_minutes)
+            ]
+            moves, unresolved = self._plan_reschedule(master, affected, first_day, last_day, days_ahead, step,
+                                                      today, now_minutes)
+            off_days = range(max(first_day, today), last_day + 1)
+            moved = self._apply_reschedule(master, off_days, moves)
+            if moved is not None:
+                return {"moved": moved, "unresolved": unresolved}
+        raise BeautySalonError("Расписание менялось во время переноса, попробуйте еще раз")
+
+    def _plan_reschedule(self, master, affected, first_day, last_day, days_ahead, step, today, now_minutes):
+        """Жадно подбирает каждой записи ближайшее свободное время, учитывая уже выбранные переносы.
+
+        Возвращает ([(запись, новый мастер, день, начало)], [записи без вариантов]).
+        """
+        drafts = {}  # (id мастера, день) -> копия DaySchedule вместе с запланированными переносами
+
+        def draft(candidate, day):
+            day_schedule = drafts.get((candidate.master_id, day))
+            if day_schedule is None:
+                day_schedule = drafts[(candidate.master_id, day)] = DaySchedule()
+                current = candidate.schedule.get(day)
+                if current is not None:
+                    day_schedule.merge(current.records)
+            return day_schedule
+
+        moves, unresolved = [], []
+        for appointment in affected:
+            duration = appointment.service.duration
+            qualified = self.service_masters.get(appointment.service.name, {}).values()
+            best = None  # (сдвиг в минутах, записей у мастера в этот день, id мастера, начало, мастер, день)
+            for day in range(appointment.day, appointment.day + days_ahead + 1):
+                for candidate in qualified:
+                    if candidate is master and first_day <= day <= last_day:
+                        continue
+                    day_schedule = draft(candidate, day)
+                    reserve = duration + candidate.break_duration
+                    not_before = now_minutes if day == today else 0
+                    starts = [start for start in candidate.iter_free_slots(day, duration, step, day_schedule.records)
+                              if start >= not_before]
+                    # Прежнее время может не попадать на сетку слотов, его проверяем отдельно
+                    original = appointment.start
+                    if (original >= not_before and candidate.is_working(day, original, duration)
+                            and day_schedule.is_free(original, original + reserve)):
+                        index = bisect_left(starts, original)
+                        if index == len(starts) or starts[index] != original:
+                            starts.insert(index, original)
+                    if not starts:
+                        continue
+                    index = bisect_left(starts, original)
+                    nearest = min(starts[max(index - 1, 0):index + 1], key=lambda start: abs(start - original))
+                    option = (abs(nearest - original), len(day_schedule), candidate.master_id, nearest, candidate, day)
+                    if best is None or option[:3] < best[:3]:
+                        best = option
+                if best is not None:
+                    break  # ближайший день с вариантами найден
+
+            if best is None:
+                unresolved.append(appointment)
+                continue
+            _, _, _, start, candidate, day = best
+            day_schedule = draft(candidate, day)
+            day_schedule.add(start, duration, "service")
+            if candidate.break_duration:
+                day_schedule.add(start + duration, candidate.break_duration, "break")
+            moves.append((appointment, candidate, day, start))
+        return moves, unresolved
+
+    def _apply_reschedule(self, master, off_days, moves):
+        """Применяет переносы все сразу и закрывает мастеру дни off_days.
+
+        Возвращает [(старая запись, новая)] или None, если расписание успело измениться.
+        """
+        keys = {(appointment.master.master_id, appointment.day) for appointment, _, _, _ in moves}
+        keys.update((candidate.master_id, day) for _, candidate, day, _ in moves)
+        keys.update((master.master_id, day) for day in off_days)
+        booked = []
+        with ExitStack() as stack:
+            # Блокировки берутся в одном порядке, поэтому два переноса не заблокируют друг друга
+            for master_id, day in sorted(keys):
+                stack.enter_context(self.masters[master_id].day_lock(day))
+
+            for appointment, candidate, day, start in moves:
+                duration = appointment.service.duration
+                if appointment.status != "confirmed" or not candidate.is_available(day, start, duration):
+                    # Пока планировали, кто-то занял время или отменил запись: откатываем и планируем заново
+                    for booked_master, booked_day, booked_start, booked_duration in booked:
+                        booked_master.remove_appointment(booked_day, booked_start, booked_duration)
+                    return None
+                candidate.add_appointment(day, start, duration)
+                booked.append((candidate, day, start, duration))
+
+            # Новые записи сохраняются раньше отмен: если хранилище их не примет, время освобождается,
+            # а старые записи остаются как были
+            created = []
+            appointment_id = self._allocate_appointment_ids(len(moves))
+            for offset, (appointment, candidate, day, start) in enumerate(moves):
+                created.append(Appointment(appointment_id + offset, appointment.client, candidate,
+                                           appointment.service, day, start))
+            if created:
+                try:
+                    self._save("record_appointments", self._register_booked_batch, created)
+                except Exception:
+                    for booked_master, booked_day, booked_start, booked_duration in booked:
+                        booked_master.remove_appointment(booked_day, booked_start, booked_duration)
+                    raise
+
+            for appointment, _, _, _ in moves:
+                appointment.cancel(notify=False)
+                if self.storage is not None:
+                    self.storage.record_status(appointment)
+            # Выходные ставятся до снятия блокировок: ни запись, ни лист ожидания не займут мастера
+            for day in off_days:
+                self._save("record_hours", self._register_hours, (master.master_id, None, day, []))
+        # Об отменах сообщаем уже без блокировок, как и Appointment.cancel
+        for appointment, _, _, _ in moves:
+            self._publish("cancelled", appointment)
+        return [(appointment, new) for (appointment, _, _, _), new in zip(moves, created)]
+
     def get_master_schedule(self, master_id, date):
         """Возвращает расписание мастера на указанную дату"""
         master = self.masters.get(master_id)
-        if master and date in master.schedule:
-            schedule_info = []
-            for time, (duration, record_type) in master.schedule[date].items():
-                if record_type == "service":
-                    schedule_info.append(f"{time} ({duration} мин)")
-                else:
-                    schedule_info.append(f"{time} (перерыв)")
-            return schedule_info
-        return []
-
-    def get_client_appointments(self, client_id):
-        client = self.clients.get(client_id)
-        if client:
-            return client.get_visit_history()
-        return []
-
-    def get_available_time_slots(self, master_id, date, service_duration):
-        """Возвращает доступные временные слоты для мастера с учетом конкретной длительности услуги"""
+        day_schedule = master.schedule.get(date_to_ordinal(date)) if master else None
+        if day_schedule is None:
+            return []
+
+        schedule_info = []
+        for start, duration, record_type in day_schedule:
+            if record_type == "service":
+                schedule_info.append(f"{minutes_to_time(start)} ({duration} мин)")
+            else:
+                schedule_info.append(f"{minutes_to_time(start)} (перерыв)")
+        return schedule_info
+
+    def get_client_appointments(self, client_id, status=None, date_from=None):
+        """Записи клиента по дате и времени; date_from=сегодня дает предстоящие визиты"""
+        if client_id not in self.clients:
+            return []
+        return self.query_appointments(client_id=client_id, status=status, date_from=date_from, limit=None)
+
+    def query_appointments(self, master_id=None, client_id=None, status=None, date_from=None, date_to=None,
+                           offset=0, limit=100, order_by="time", newest_first=False):
+        """Выбирает записи по мастеру, клиенту, статусу и диапазону дат (границы включаются).
+
+        Условия объединяются через И, незаданные не проверяются. order_by="time" - по дате и времени,
+        order_by="id" - по номеру записи; offset и limit задают страницу (limit=None - без ограничения).
+        """
+        day_from = date_to_ordinal(date_from) if date_from else None
+        day_to = date_to_ordinal(date_to) if date_to else None
+        query_ids = getattr(self.storage, "query_appointment_ids", None)
+        if query_ids is not None and status is not None and master_id is None and client_id is None:
+            # Выборка только по статусу и датам идет по индексу базы, а не перебором дней в памяти
+            ids = query_ids(status, day_from, day_to, offset, limit, order_by, newest_first)
+            return [self.appointments[appointment_id] for appointment_id in ids]
+        return self.appointment_index.query(master_id, client_id, status, day_from, day_to, offset, limit, order_by,
+                                            newest_first)
+
+    def iter_appointments(self, master_id=None, client_id=None, status=None, date_from=None, date_to=None):
+        """Лениво перебирает записи по дате и времени с теми же условиями, что query_appointments"""
+        return self.appointment_index.iter_query(
+            master_id, client_id, status,
+            date_to_ordinal(date_from) if date_from else None,
+            date_to_ordinal(date_to) if date_to else None)
+
+    def get_report(self, date_from=None, date_to=None, group_by=None):
+        """Сводка за период (границы включаются): записи, минуты услуг и перерывов, выручка, отмены.
+
+        group_by=None - по салону, "master" - {id мастера: сводка}, "category" - {категория: сводка},
+        "day" - [(дата, сводка)] за дни с записями. Если заданы обе даты, сводки салона и мастеров
+        содержат еще working_minutes и utilization - долю рабочего времени, занятую услугами.
+        """
+        day_from = date_to_ordinal(date_from) if date_from else None
+        day_to = date_to_ordinal(date_to) if date_to else None
+        if day_from is not None and day_to is not None and day_from > day_to:
+            raise ValidationError("Начало периода позже его конца")
+        if group_by == "day":
+            if day_from is None or day_to is None:
+                raise ValidationError("Для сводки по дням нужны обе даты")
+            return [(ordinal_to_date(day), fields) for day, fields in self.aggregates.per_day(day_from, day_to)]
+        if group_by == "category":
+            return self.aggregates.per_category(day_from, day_to)
+        if group_by == "master":
+            report = self.aggregates.per_master(day_from, day_to)
+            if day_from is not None and day_to is not None:
+                for master in list(self.masters.values()):
+                    fields = report.setdefault(master.master_id, dict.fromkeys(FIELDS, 0))
+                    self._add_utilization(fields, master.working_minutes(day_from, day_to))
+            return report
+        if group_by is not None:
+            raise ValidationError(f"Неизвестная группировка: {group_by}")
+        report = self.aggregates.totals(day_from, day_to)
+        if day_from is not None and day_to is not None:
+            self._add_utilization(report, sum(master.working_minutes(day_from, day_to)
+                                              for master in list(self.masters.values())))
+        return report
+
+    @staticmethod
+    def _add_utilization(fields, working_minutes):
+        fields["working_minutes"] = working_minutes
+        fields["utilization"] = round(fields["booked_minutes"] / working_minutes, 4) if working_minutes else 0.0
+
+    def iter_available_time_slots(self, master_id, date, service_duration, step=SLOT_STEP):
+        """Лениво перебирает доступные временные слоты мастера за один проход по его записям"""
         master = self.masters.get(master_id)
         if not master:
-            return []
+            return iter(())
+        return map(minutes_to_time, master.iter_free_slots(date_to_ordinal(date), service_duration, step))
 
-        available_slots = []
+    @instrumented("get_available_time_slots")
+    def get_available_time_slots(self, master_id, date, service_duration, step=SLOT_STEP):
+        """Возвращает доступные временные слоты для мастера с учетом конкретной длительности услуги.
 
-        # Рабочий день с 9:00 до 21:00
-        start_time = datetime.strptime("09:00", "%H:%M")
-        end_time = datetime.strptime("21:00", "%H:%M")
+        Ответ берется из кэша, пока расписание мастера на этот день не менялось.
+        """
+        master = self.masters.get(master_id)
+        if not master:
+            return []
+        day = date_to_ordinal(date)
+        key = (master_id, day, service_duration, step)
+        # Версию и слоты читаем под блокировкой дня, чтобы они соответствовали друг другу
+        with master.day_lock(day):
+            version = master.schedule_version(day)
+            slots = self.slot_cache.get(key, version)
+            if slots is None:
+                slots = tuple(map(minutes_to_time, master.iter_free_slots(day, service_duration, step)))
+                self.slot_cache.put(key, version, slots)
+        return list(slots)
+
+    def get_slot_cache_stats(self):
+        """Попадания, промахи и доля попаданий кэша свободного времени"""
+        return self.slot_cache.stats()
+
+    def plan_visit(self, service_ids, date, ordered=True, limit=5, max_wait=None, step=SLOT_STEP):
+        """Подбирает варианты визита из нескольких услуг подряд у одного или разных мастеров.
+
+        service_ids - услуги в нужном порядке; ordered=False разрешает любой порядок.
+        max_wait - сколько минут клиент готов ждать между двумя услугами (None - сколько угодно).
+        Возвращает до limit вариантов с наименьшим суммарным ожиданием между услугами, при равном
+        ожидании - с более ранним началом: [{"start", "end", "wait", "steps": [(услуга, мастер, время)]}].
+        """
+        services = [self.services.get(service_id) for service_id in service_ids]
+        if not services or not all(services):
+            raise ValidationError("Не найдены услуги")
+        day = date_to_ordinal(date)
+        self.validator.validate_future_day(day)
+        now = datetime.now()
+        not_before = now.hour * 60 + now.minute if day == now.toordinal() else 0
+
+        # Свободные начала каждого мастера для каждой услуги считаются один раз на весь поиск
+        free = {}  # {id услуги: [(мастер, отсортированные свободные начала)]}
+        for service in services:
+            if service.service_id in free:
+                continue
+            free[service.service_id] = options = []
+            for master in self.service_masters.get(service.name, {}).values():
+                with master.day_lock(day):
+                    starts = [start for start in master.iter_free_slots(day, service.duration, step)
+                              if start >= not_before]
+                if starts:
+                    options.append((master, starts))
+
+        orders = [tuple(services)] if ordered else list(dict.fromkeys(permutations(services)))
+        found = []  # [((ожидание, начало, конец, номер), цепочка)] по возрастанию, не больше limit
+        counter = count()
+        ready = {}  # {id мастера: когда он освободится после услуг этой цепочки, с перерывом}
+        chain = []  # [(услуга, мастер, начало)]
+
+        def extend(order, index, end, wait):
+            if index == len(order):
+                insort(found, ((wait, chain[0][2], end, next(counter)), tuple(chain)))
+                del found[limit:]
+                return
+            service = order[index]
+            # У каждого мастера дальше выгоднее всего самое раннее возможное начало:
+            # более позднее не сократит ни ожидание, ни время окончания визита
+            candidates = []
+            for master, starts in free[service.service_id]:
+                position = bisect_left(starts, max(end, ready.get(master.master_id, 0)))
+                if position < len(starts):
+                    candidates.append((starts[position], master.master_id, master))
+            candidates.sort()
+            for start, master_id, master in candidates:
+                gap = start - end
+                if max_wait is not None and gap > max_wait:
+                    break
+                # Граница: цепочка уже ждет дольше худшего из найденных вариантов
+                if len(found) == limit and wait + gap > found[-1][0][0]:
+                    break
+                previous_ready = ready.get(master_id)
+                ready[master_id] = start + service.duration + master.break_duration
+                chain.append((service, master, start))
+                extend(order, index + 1, start + service.duration, wait + gap)
+                chain.pop()
+                if previous_ready is None:
+                    del ready[master_id]
+                else:
+                    ready[master_id] = previous_ready
+
+        # Первые услуги перебираем по времени начала: когда найдено limit вариантов без ожидания,
+        # более поздние начала их уже не обгонят
+        firsts = sorted((start, master.master_id, order_index, master)
+                        for order_index, order in enumerate(orders)
+                        for master, starts in free[order[0].service_id] for start in starts)
+        for start, master_id, order_index, master in firsts:
+            if len(found) == limit and found[-1][0][:2] <= (0, start):
+                break
+            order = orders[order_index]
+            ready[master_id] = start + order[0].duration + master.break_duration
+            chain.append((order[0], master, start))
+            extend(order, 1, start + order[0].duration, 0)
+            chain.pop()
+            del ready[master_id]
+
+        return [
+            {"start": minutes_to_time(start), "end": minutes_to_time(end), "wait": wait,
+             "steps": [(service, master, minutes_to_time(step_start)) for service, master, step_start in steps]}
+            for (wait, start, end, _), steps in found
+        ]
+
+    def find_earliest_slots(self, service_id, date_from, date_to, limit=5, step=SLOT_STEP):
+        """Возвращает до limit самых ранних вариантов (мастер, дата, время) среди всех мастеров услуги"""
+        service = self.services.get(service_id)
+        if not service:
+            return []
 
-        current_time = start_time
-        while current_time + timedelta(minutes=service_duration) <= end_time:
-            time_slot = current_time.strftime("%H:%M")
+        # Прошедшее время пропускаем: на него все равно нельзя записаться
+        now = datetime.now()
+        first_day = max(date_to_ordinal(date_from), now.toordinal())
+        last_day = date_to_ordinal(date_to)
+        now_minutes = now.hour * 60 + now.minute if first_day == now.toordinal() else 0
 
-            # Проверяем доступность с учетом КОНКРЕТНОЙ ДЛИТЕЛЬНОСТИ услуги
-            if master.is_available(date, time_slot, service_duration):
-                available_slots.append(time_slot)
+        streams = [
+            self._iter_master_days(master, service.duration, first_day, last_day, step, now_minutes)
+            for master in self.service_masters.get(service.name, {}).values()
+        ]
 
-            current_time += timedelta(minutes=15)  # проверяем каждые 15 минут
+        # Потоки каждого мастера уже упорядочены, слияние через кучу останавливается после limit вариантов
+        return [
+            (self.masters[master_id], ordinal_to_date(day), minutes_to_time(start))
+            for day, start, master_id in islice(heapq.merge(*streams), limit)
+        ]
 
-        return available_slots
+    @staticmethod
+    def _iter_master_days(master, duration, first_day, last_day, step, not_before=0):
+        """Лениво перебирает свободные слоты мастера по дням в виде (номер дня, минуты, id мастера)"""
+        for day in range(first_day, last_day + 1):
+            for start in master.iter_free_slots(day, duration, step):
+                if start >= not_before:
+                    yield day, start, master.master_id
+            not_before = 0
 
 
 def main():
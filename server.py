@@ -0,0 +1,327 @@
+"""Локальный HTTP/JSON-сервис записи в салон без графического интерфейса.
+
+Запуск: python server.py --journal salon_journal.log --port 8080 [--outbox reminders/]
+
+GET  /slots?master_id=1&service_id=2&date=2024-01-15[&step=15]   свободное время мастера
+GET  /earliest?service_id=2&date_from=...&date_to=...[&limit=5]   ближайшее время у всех мастеров
+GET  /visit?service_ids=1,3&date=...[&ordered=1&limit=5&max_wait=30]   несколько услуг подряд за один визит
+GET  /clients?q=Петров                                            поиск клиентов
+GET  /appointments?master_id=&client_id=&status=&date_from=&date_to=[&offset=0&limit=100]   выборка записей
+POST /appointments  {"client_id", "master_id", "service_id", "date", "time_slot"}
+POST /appointments/<id>/cancel
+POST /waitlist  {"client_id", "service_id", "date_from", "date_to"[, "master_id", "time_from", "time_to"]}
+GET  /waitlist/<id>                                               состояние заявки листа ожидания
+POST /masters/<id>/reschedule  {"date_from", "date_to"}           перенос записей мастера к другим мастерам
+GET  /report?date_from=...&date_to=...[&group_by=master|category|day]   выручка, минуты и отмены за период
+GET  /metrics                                                     счетчики и задержки (при запуске с --metrics)
+"""
+import argparse
+import asyncio
+import json
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from salon import BeautySalon
+from exceptions import ValidationError
+from journal import SalonJournal
+from storage import SQLiteStorage
+from waitlist import Waitlist
+from reminders import ReminderScheduler
+
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 409: "Conflict",
+               500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def appointment_to_dict(appointment):
+    return {
+        "appointment_id": appointment.appointment_id,
+        "client_id": appointment.client.client_id,
+        "master_id": appointment.master.master_id,
+        "service_id": appointment.service.service_id,
+        "date": appointment.date,
+        "time_slot": appointment.time_slot,
+        "status": appointment.status,
+    }
+
+
+def waitlist_entry_to_dict(entry):
+    return {
+        "entry_id": entry.entry_id,
+        "client_id": entry.client.client_id,
+        "service_id": entry.service.service_id,
+        "master_id": entry.master.master_id if entry.master is not None else None,
+        "status": entry.status,
+        "appointment": appointment_to_dict(entry.appointment) if entry.appointment is not None else None,
+    }
+
+
+class BookingServer:
+    """Обслуживает запросы к одному салону; вызовы салона выполняются в пуле потоков"""
+
+    def __init__(self, salon, max_concurrency=8):
+        self.salon = salon
+        self.waitlist = Waitlist(salon)  # освободившееся при отменах время сразу записывает ожидающих
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="salon-http")
+        self.semaphore = asyncio.Semaphore(max_concurrency)  # не больше max_concurrency вызовов салона сразу
+        self.inflight = {}  # {ключ запроса свободного времени: задача}, одинаковые запросы ждут одну задачу
+        self.coalesced = 0  # сколько запросов получили результат чужой задачи
+
+    async def call(self, func, *args):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def coalesce(self, key, func, *args):
+        """Выполняет запрос, а одинаковые запросы, пришедшие до его завершения, получают тот же результат"""
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self.call(func, *args))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def handle(self, method, path, query, body):
+        """Возвращает (код ответа, JSON-объект)"""
+        parts = [part for part in path.split('/') if part]
+        if method == "GET" and parts == ["slots"]:
+            master_id, service_id = int_param(query, "master_id"), int_param(query, "service_id")
+            date, step = str_param(query, "date"), int_param(query, "step", 15)
+            service = self.salon.services.get(service_id)
+            if service is None:
+                raise HTTPError(404, "Услуга не найдена")
+            slots = await self.coalesce(("slots", master_id, date, service.duration, step),
+                                        self.salon.get_available_time_slots, master_id, date, service.duration, step)
+            return 200, {"slots": slots}
+
+        if method == "GET" and parts == ["earliest"]:
+            args = (int_param(query, "service_id"), str_param(query, "date_from"), str_param(query, "date_to"),
+                    int_param(query, "limit", 5))
+            options = await self.coalesce(("earliest",) + args, self.salon.find_earliest_slots, *args)
+            return 200, {"options": [{"master_id": master.master_id, "master": master.name, "date": date,
+                                      "time_slot": time_slot} for master, date, time_slot in options]}
+
+        if method == "GET" and parts == ["visit"]:
+            try:
+                service_ids = [int(service_id) for service_id in str_param(query, "service_ids").split(",")]
+            except ValueError:
+                raise HTTPError(400, "Параметр service_ids - номера услуг через запятую")
+            max_wait = int_param(query, "max_wait") if "max_wait" in query else None
+            try:
+                plans = await self.call(self.salon.plan_visit, service_ids, str_param(query, "date"),
+                                        query.get("ordered", "1") != "0", int_param(query, "limit", 5), max_wait)
+            except ValidationError as e:
+                raise HTTPError(400, str(e))
+            return 200, {"plans": [{"start": plan["start"], "end": plan["end"], "wait": plan["wait"],
+                                    "steps": [{"service_id": service.service_id, "master_id": master.master_id,
+                                               "master": master.name, "time_slot": time_slot}
+                                              for service, master, time_slot in plan["steps"]]}
+                                   for plan in plans]}
+
+        if method == "GET" and parts == ["clients"]:
+            clients = await self.call(self.salon.search_clients, str_param(query, "q"), int_param(query, "limit", 20))
+            return 200, {"clients": [{"client_id": c.client_id, "name": c.name, "phone": c.phone, "email": c.email}
+                                     for c in clients]}
+
+        if method == "GET" and parts == ["appointments"]:
+            filters = {name: int_param(query, name) for name in ("master_id", "client_id") if name in query}
+            filters.update({name: query[name] for name in ("status", "date_from", "date_to") if name in query})
+            appointments = await self.call(lambda: self.salon.query_appointments(
+                offset=int_param(query, "offset", 0), limit=min(int_param(query, "limit", 100), 1000), **filters))
+            return 200, {"appointments": [appointment_to_dict(a) for a in appointments]}
+
+        if method == "POST" and parts == ["appointments"]:
+            try:
+                args = (int(body["client_id"]), int(body["master_id"]), int(body["service_id"]),
+                        str(body["date"]), str(body["time_slot"]))
+            except (KeyError, TypeError, ValueError):
+                raise HTTPError(400, "Нужны client_id, master_id, service_id, date и time_slot")
+            appointment, message = await self.call(self.salon.create_appointment, *args)
+            if appointment is None:
+                raise HTTPError(409, message)
+            return 201, {"appointment": appointment_to_dict(appointment), "message": message}
+
+        if method == "POST" and len(parts) == 3 and parts[0] == "appointments" and parts[2] == "cancel":
+            try:
+                appointment_id = int(parts[1])
+            except ValueError:
+                raise HTTPError(400, "Неверный номер записи")
+            success, message = await self.call(self.salon.cancel_appointment, appointment_id)
+            if not success:
+                raise HTTPError(404, message)
+            return 200, {"message": message}
+
+        if method == "POST" and parts == ["waitlist"]:
+            try:
+                args = (int(body["client_id"]), int(body["service_id"]), str(body["date_from"]), str(body["date_to"]),
+                        int(body["master_id"]) if body.get("master_id") is not None else None,
+                        body.get("time_from"), body.get("time_to"))
+            except (KeyError, TypeError, ValueError):
+                raise HTTPError(400, "Нужны client_id, service_id, date_from и date_to")
+            try:
+                entry = await self.call(self.waitlist.add, *args)
+            except ValidationError as e:
+                raise HTTPError(400, str(e))
+            return 201, {"entry": waitlist_entry_to_dict(entry)}
+
+        if method == "GET" and len(parts) == 2 and parts[0] == "waitlist":
+            try:
+                entry_id = int(parts[1])
+            except ValueError:
+                raise HTTPError(400, "Неверный номер заявки")
+            entry = await self.call(self.waitlist.get, entry_id)
+            if entry is None:
+                raise HTTPError(404, "Заявка не найдена")
+            return 200, {"entry": waitlist_entry_to_dict(entry)}
+
+        if method == "POST" and len(parts) == 3 and parts[0] == "masters" and parts[2] == "reschedule":
+            try:
+                master_id, date_from, date_to = int(parts[1]), str(body["date_from"]), str(body["date_to"])
+            except (KeyError, TypeError, ValueError):
+                raise HTTPError(400, "Нужны номер мастера, date_from и date_to")
+            if master_id not in self.salon.masters:
+                raise HTTPError(404, "Мастер не найден")
+            report = await self.call(self.salon.reschedule_master, master_id, date_from, date_to)
+            return 200, {"moved": [{"from": appointment_to_dict(old), "to": appointment_to_dict(new)}
+                                   for old, new in report["moved"]],
+                         "unresolved": [appointment_to_dict(a) for a in report["unresolved"]]}
+
+        if method == "GET" and parts == ["report"]:
+            group_by = query.get("group_by")
+            try:
+                report = await self.call(self.salon.get_report, query.get("date_from"), query.get("date_to"), group_by)
+            except ValidationError as e:
+                raise HTTPError(400, str(e))
+            if group_by == "day":
+                report = [dict(fields, date=date) for date, fields in report]
+            return 200, {"report": report}
+
+        if method == "GET" and parts == ["metrics"]:
+            snapshot = self.salon.get_metrics()
+            if snapshot is None:
+                raise HTTPError(404, "Метрики выключены, запустите сервис с --metrics")
+            snapshot["coalesced_requests"] = self.coalesced
+            snapshot["slot_cache"] = self.salon.get_slot_cache_stats()
+            return 200, snapshot
+
+        raise HTTPError(404, "Неизвестный адрес")
+
+    async def serve_connection(self, reader, writer):
+        """Обрабатывает запросы одного соединения (поддерживает keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                raw_body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.respond(method.upper(), target, raw_body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, raw_body):
+        url = urlsplit(target)
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            return await self.handle(method, url.path, dict(parse_qsl(url.query)), body)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+
+def str_param(query, name):
+    if name not in query:
+        raise HTTPError(400, f"Не указан параметр {name}")
+    return query[name]
+
+
+def int_param(query, name, default=None):
+    if name not in query and default is not None:
+        return default
+    try:
+        return int(str_param(query, name))
+    except ValueError:
+        raise HTTPError(400, f"Параметр {name} должен быть числом")
+
+
+async def run_server(salon, host, port, max_concurrency):
+    booking_server = BookingServer(salon, max_concurrency)
+    server = await asyncio.start_server(booking_server.serve_connection, host, port)
+    print(f"Сервис записи запущен на http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON-сервис записи в салон красоты")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--journal", help="файл журнала салона (как у графического интерфейса)")
+    parser.add_argument("--db", help="база SQLite вместо журнала")
+    parser.add_argument("--metrics", action="store_true", help="собирать счетчики и задержки операций (GET /metrics)")
+    parser.add_argument("--outbox", help="каталог, куда писать напоминания о записях для отправщика")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="сколько запросов к салону выполнять сразу")
+    args = parser.parse_args()
+
+    salon = BeautySalon("Элит Салон")
+    if args.metrics:
+        salon.enable_metrics()
+    storage = None
+    if args.db:
+        # Ответ об успехе уходит клиенту только после фиксации изменения в базе
+        storage = SQLiteStorage(args.db, batch_size=1)
+    elif args.journal:
+        storage = SalonJournal(args.journal)
+    if storage is not None:
+        storage.load(salon)
+    # SIGTERM останавливает сервис как Ctrl+C, чтобы хранилище успело закрыться
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    reminders = None
+    if args.outbox:
+        reminders = ReminderScheduler(salon, args.outbox)
+        reminders.start()
+
+    try:
+        asyncio.run(run_server(salon, args.host, args.port, args.max_concurrency))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if reminders is not None:
+            reminders.stop()
+        if storage is not None:
+            storage.close()
+
+
+if __name__ == "__main__":
+    main()
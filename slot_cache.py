@@ -0,0 +1,52 @@
+from collections import OrderedDict
+import threading
+
+
+class SlotCache:
+    """LRU-кэш списков свободного времени.
+
+    Каждое значение хранится вместе с версией дня мастера, для которой оно посчитано
+    (DaySchedule.version). Если с тех пор день менялся, значение считается устаревшим.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # {ключ: (версия дня, слоты)}, последние использованные в конце
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Возвращает слоты, посчитанные для этой версии дня, или None"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, slots):
+        with self._lock:
+            self.entries[key] = (version, slots)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Попадания, промахи и доля попаданий с момента создания или clear()"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,311 @@
+from collections import OrderedDict
+from itertools import count
+import json
+import sqlite3
+import threading
+
+from client_index import normalize_phone
+from salon import (Client, Service, Master, Appointment, DaySchedule, date_to_ordinal, ordinal_to_date,
+                   time_to_minutes)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    client_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    phone_key TEXT NOT NULL,  -- телефон только из цифр (см. normalize_phone)
+    email TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_clients_phone ON clients (phone_key);
+
+CREATE TABLE IF NOT EXISTS services (
+    service_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    category TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS masters (
+    master_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    specialization TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    break_duration INTEGER NOT NULL
+);
+
+-- Рабочие часы: day - день недели (0-6) или дата YYYY-MM-DD для исключения,
+-- intervals - JSON [[начало, конец], ...] в минутах от полуночи
+CREATE TABLE IF NOT EXISTS master_hours (
+    master_id INTEGER NOT NULL REFERENCES masters,
+    day TEXT NOT NULL,
+    intervals TEXT NOT NULL,
+    PRIMARY KEY (master_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id INTEGER PRIMARY KEY,
+    client_id INTEGER NOT NULL REFERENCES clients,
+    master_id INTEGER NOT NULL REFERENCES masters,
+    service_id INTEGER NOT NULL REFERENCES services,
+    date TEXT NOT NULL,
+    time_slot TEXT NOT NULL,
+    start INTEGER NOT NULL,  -- начало в минутах от полуночи
+    end INTEGER NOT NULL,  -- конец вместе с перерывом после услуги
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_master_date ON appointments (master_id, date, start);
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments (status, date, start);
+"""
+
+# Сколько дней расписания каждого мастера держать в памяти
+CACHED_DAYS = 512
+
+# Версии загруженных дней: у дня, вытесненного и загруженного заново, версия не повторится,
+# поэтому кэш свободного времени не выдаст слоты, посчитанные до вытеснения
+_day_loads = count(1)
+
+
+class ScheduleDays:
+    """Расписание мастера по дням из базы - замена словаря Master.schedule.
+
+    День читается из базы при первом обращении (пустой день тоже запоминается), в памяти остаются
+    не больше capacity последних использованных дней. Вытесняется только день, блокировку которого
+    (Master.day_lock) никто не держит: салон меняет день и записывает изменение в базу под этой
+    блокировкой, поэтому свободный от нее день в памяти совпадает с базой.
+    """
+
+    __slots__ = ("master", "loader", "capacity", "days", "_lock")
+
+    def __init__(self, master, loader, capacity=CACHED_DAYS):
+        self.master = master
+        self.loader = loader  # loader(мастер, номер дня) -> отсортированные (начало, длительность, тип)
+        self.capacity = capacity
+        self.days = OrderedDict()  # {номер дня: DaySchedule}, последние использованные в конце
+        self._lock = threading.Lock()
+
+    def get(self, day, default=None):
+        with self._lock:
+            day_schedule = self.days.get(day)
+            if day_schedule is not None:
+                self.days.move_to_end(day)
+                return day_schedule
+            day_schedule = DaySchedule()
+            day_schedule.merge(self.loader(self.master, day))
+            day_schedule.version = next(_day_loads) << 32
+            self.days[day] = day_schedule
+            self._evict()
+            return day_schedule
+
+    __getitem__ = get
+
+    def __setitem__(self, day, day_schedule):
+        with self._lock:
+            self.days[day] = day_schedule
+            self.days.move_to_end(day)
+            self._evict()
+
+    def __len__(self):
+        return len(self.days)
+
+    def _evict(self):
+        for day in list(self.days):
+            if len(self.days) <= self.capacity:
+                return
+            lock = self.master.day_locks.get(day)
+            if lock is None:
+                del self.days[day]
+            else:
+                lock.if_idle(lambda day=day: self.days.pop(day, None))
+
+
+class SQLiteStorage:
+    """Хранилище салона в локальной базе SQLite.
+
+    При запуске в салон загружаются клиенты, услуги, мастера и записи, но не расписания мастеров:
+    занятое время дня читается по индексу (master_id, date) при первом обращении, и в памяти
+    держится не больше cached_days дней на мастера (см. ScheduleDays). Поиск клиента по телефону
+    и выборки записей только по статусу и датам тоже идут по индексам базы.
+
+    Изменения записываются сразу, а фиксируются пачками по batch_size операций,
+    чтобы не платить за отдельную транзакцию на каждую запись, но не позже чем через
+    max_delay секунд после первой операции пачки. batch_size=1 - фиксировать каждую операцию.
+    """
+
+    def __init__(self, path, batch_size=100, max_delay=0.05, cached_days=CACHED_DAYS):
+        self.path = path
+        self.cached_days = cached_days
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.salon = None
+        self.pending = 0  # операций в незафиксированной транзакции
+        self._timer = None  # отложенная фиксация неполной пачки
+        # Соединение общее для всех потоков салона, обращения к нему идут под блокировкой;
+        # салон держит ее и пока вносит записанное изменение
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.executescript(SCHEMA)
+
+    def load(self, salon):
+        """Загружает состояние салона из базы и начинает записывать в нее изменения"""
+        cursor = self.connection.cursor()
+        for client_id, name, phone, email in cursor.execute(
+                "SELECT client_id, name, phone, email FROM clients ORDER BY client_id"):
+            salon._register_client(Client(client_id, name, phone, email))
+        for row in cursor.execute(
+                "SELECT service_id, name, duration, price, category FROM services ORDER BY service_id"):
+            salon._register_service(Service(*row))
+        for master_id, name, specialization, phone, break_duration in cursor.execute(
+                "SELECT master_id, name, specialization, phone, break_duration FROM masters ORDER BY master_id"):
+            master = Master(master_id, name, json.loads(specialization), phone, break_duration)
+            self._attach(master)
+            salon._register_master(master)
+        for master_id, day, intervals in cursor.execute("SELECT master_id, day, intervals FROM master_hours"):
+            hours = [tuple(interval) for interval in json.loads(intervals)]
+            if day.isdigit():
+                salon._register_hours((master_id, int(day), None, hours))
+            else:
+                salon._register_hours((master_id, None, date_to_ordinal(day), hours))
+        for appointment_id, client_id, master_id, service_id, date, time_slot, status in cursor.execute(
+                "SELECT appointment_id, client_id, master_id, service_id, date, time_slot, status "
+                "FROM appointments ORDER BY appointment_id"):
+            appointment = Appointment(appointment_id, salon.clients[client_id], salon.masters[master_id],
+                                      salon.services[service_id], date_to_ordinal(date), time_to_minutes(time_slot))
+            appointment.status = status
+            # Время у мастера не занимаем: расписание дня прочитается из базы
+            salon._register_appointment(appointment, book=False)
+
+        self.salon = salon
+        salon.storage = self
+        return salon
+
+    def flush(self):
+        """Фиксирует накопленную транзакцию"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.pending:
+                self.connection.commit()
+                self.pending = 0
+
+    def close(self):
+        """Фиксирует изменения и закрывает базу; расписания мастеров салона после этого не читаются"""
+        with self.lock:
+            self.flush()
+            self.connection.close()
+        if self.salon is not None and self.salon.storage is self:
+            self.salon.storage = None
+
+    def record_client(self, client):
+        self._execute("INSERT INTO clients (client_id, name, phone, phone_key, email) VALUES (?, ?, ?, ?, ?)",
+                      (client.client_id, client.name, client.phone, normalize_phone(client.phone), client.email))
+
+    def record_service(self, service):
+        self._execute("INSERT INTO services (service_id, name, duration, price, category) VALUES (?, ?, ?, ?, ?)",
+                      (service.service_id, service.name, service.duration, service.price, service.category))
+
+    def record_master(self, master):
+        self._execute("INSERT INTO masters (master_id, name, specialization, phone, break_duration) "
+                      "VALUES (?, ?, ?, ?, ?)",
+                      (master.master_id, master.name, json.dumps(master.specialization, ensure_ascii=False),
+                       master.phone, master.break_duration))
+        self._attach(master)
+
+    def record_hours(self, item):
+        master_id, weekday, day, hours = item
+        key = str(weekday) if weekday is not None else ordinal_to_date(day)
+        if hours is None:
+            self._execute("DELETE FROM master_hours WHERE master_id = ? AND day = ?", (master_id, key))
+        else:
+            self._execute("INSERT OR REPLACE INTO master_hours (master_id, day, intervals) VALUES (?, ?, ?)",
+                          (master_id, key, json.dumps(hours)))
+
+    def record_appointment(self, appointment):
+        self._execute("INSERT INTO appointments (appointment_id, client_id, master_id, service_id, date, time_slot, "
+                      "start, end, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      self._appointment_row(appointment))
+
+    def record_appointments(self, appointments):
+        """Записывает несколько записей одним executemany"""
+        rows = [self._appointment_row(appointment) for appointment in appointments]
+        with self.lock:
+            self.connection.executemany("INSERT INTO appointments (appointment_id, client_id, master_id, service_id, "
+                                        "date, time_slot, start, end, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        rows)
+            self._written(len(rows))
+
+    def record_status(self, appointment):
+        self._execute("UPDATE appointments SET status = ? WHERE appointment_id = ?",
+                      (appointment.status, appointment.appointment_id))
+
+    def find_client_id(self, phone):
+        """id клиента с таким телефоном в любом формате записи или None"""
+        phone_key = normalize_phone(phone)
+        if not phone_key:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT client_id FROM clients WHERE phone_key = ? LIMIT 1",
+                                          (phone_key,)).fetchone()
+        return row[0] if row else None
+
+    def query_appointment_ids(self, status, day_from=None, day_to=None, offset=0, limit=None, order_by="time",
+                              newest_first=False):
+        """id записей со статусом status за дни [day_from, day_to] в порядке BeautySalon.query_appointments"""
+        conditions, parameters = ["status = ?"], [status]
+        if day_from is not None:
+            conditions.append("date >= ?")
+            parameters.append(ordinal_to_date(day_from))
+        if day_to is not None:
+            conditions.append("date <= ?")
+            parameters.append(ordinal_to_date(day_to))
+        columns = ("appointment_id",) if order_by == "id" else ("date", "start", "appointment_id")
+        direction = " DESC" if newest_first else ""
+        parameters += [-1 if limit is None else limit, offset]
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT appointment_id FROM appointments WHERE {' AND '.join(conditions)} "
+                f"ORDER BY {', '.join(column + direction for column in columns)} LIMIT ? OFFSET ?",
+                parameters).fetchall()
+        return [row[0] for row in rows]
+
+    def load_day(self, master, day):
+        """Занятые интервалы мастера на день: [(начало, длительность, тип записи)] по возрастанию"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT a.start, a.end, s.duration FROM appointments a JOIN services s USING (service_id) "
+                "WHERE a.master_id = ? AND a.date = ? AND a.status != 'cancelled' ORDER BY a.start",
+                (master.master_id, ordinal_to_date(day))).fetchall()
+        records = []
+        for start, end, duration in rows:
+            records.append((start, duration, "service"))
+            if end > start + duration:
+                records.append((start + duration, end - start - duration, "break"))
+        return records
+
+    def _attach(self, master):
+        master.schedule = ScheduleDays(master, self.load_day, self.cached_days)
+
+    def _execute(self, sql, parameters):
+        # sqlite3 кэширует подготовленные выражения по тексту запроса
+        with self.lock:
+            self.connection.execute(sql, parameters)
+            self._written(1)
+
+    def _written(self, count):
+        self.pending += count
+        if self.pending >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.max_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @staticmethod
+    def _appointment_row(appointment):
+        start = appointment.start
+        end = start + appointment.service.duration + appointment.master.break_duration
+        return (appointment.appointment_id, appointment.client.client_id, appointment.master.master_id,
+                appointment.service.service_id, appointment.date, appointment.time_slot, start, end,
+                appointment.status)
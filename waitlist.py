@@ -0,0 +1,213 @@
+from datetime import datetime
+from itertools import count
+import threading
+
+from salon import SLOT_STEP, date_to_ordinal, ordinal_to_date, time_to_minutes, minutes_to_time
+from exceptions import ValidationError
+
+
+# На сколько дней вперед можно встать в лист ожидания одной заявкой
+WAITLIST_MAX_DAYS = 31
+DAY_END = 24 * 60
+
+
+class WaitlistEntry:
+    """Заявка клиента: услуга в окне дат (и часов) у выбранного или любого мастера"""
+
+    __slots__ = ("entry_id", "client", "service", "master", "first_day", "last_day", "earliest", "latest",
+                 "auto_book", "status", "offer", "appointment")
+
+    def __init__(self, entry_id, client, service, master, first_day, last_day, earliest, latest, auto_book):
+        self.entry_id = entry_id
+        self.client = client
+        self.service = service
+        self.master = master  # None - подходит любой мастер с этой услугой
+        self.first_day = first_day
+        self.last_day = last_day
+        self.earliest = earliest  # окно часов в минутах от полуночи: услуга должна уложиться в него
+        self.latest = latest
+        self.auto_book = auto_book
+        self.status = "waiting"  # waiting, offered, booked, removed, expired
+        self.offer = None  # (мастер, номер дня, начало) для предложенного времени
+        self.appointment = None
+
+    def __str__(self):
+        return (f"Заявка {self.entry_id}: {self.client.name}, {self.service.name}, "
+                f"{ordinal_to_date(self.first_day)} - {ordinal_to_date(self.last_day)} ({self.status})")
+
+
+class Waitlist:
+    """Лист ожидания салона.
+
+    Заявка лежит в корзинах (день, услуга) всех дней своего окна. Когда запись отменяется (в том числе
+    при переносе), проверяются только заявки из корзин ее дня и услуг ее мастера, чье окно часов
+    пересекается с освободившимся интервалом, в порядке подачи. Заявки с auto_book записываются сразу,
+    остальным время предлагается через on_offer(заявка) и не держится до accept. Заявки хранятся в памяти.
+    """
+
+    def __init__(self, salon, on_offer=None, step=SLOT_STEP):
+        self.salon = salon
+        self.on_offer = on_offer
+        self.step = step
+        self.entries = {}  # {id заявки: WaitlistEntry}
+        self.buckets = {}  # {(номер дня, название услуги): {id заявки: заявка}}, в порядке подачи
+        self._ids = count(1)
+        # Подбор идет под этой блокировкой, чтобы одно освободившееся время не досталось двум заявкам
+        self._lock = threading.RLock()
+        salon.subscribe(self.on_change)
+
+    def add(self, client_id, service_id, date_from, date_to, master_id=None, time_from=None, time_to=None,
+            auto_book=True):
+        """Ставит клиента в лист ожидания; если подходящее время уже свободно, сразу записывает или предлагает его"""
+        client = self.salon.clients.get(client_id)
+        service = self.salon.services.get(service_id)
+        if client is None or service is None:
+            raise ValidationError("Не найдены клиент или услуга")
+        master = None
+        if master_id is not None:
+            master = self.salon.service_masters.get(service.name, {}).get(master_id)
+            if master is None:
+                raise ValidationError("Мастер не найден или не оказывает эту услугу")
+
+        today = datetime.now().toordinal()
+        first_day, last_day = max(date_to_ordinal(date_from), today), date_to_ordinal(date_to)
+        if first_day > last_day:
+            raise ValidationError("Окно дат уже прошло или задано неверно")
+        if last_day - first_day >= WAITLIST_MAX_DAYS:
+            raise ValidationError(f"Окно дат не может быть длиннее {WAITLIST_MAX_DAYS} дней")
+        earliest = time_to_minutes(time_from) if time_from else 0
+        latest = time_to_minutes(time_to) if time_to else DAY_END
+        if latest - earliest < service.duration:
+            raise ValidationError("Услуга не помещается в окно часов")
+
+        with self._lock:
+            self._prune(today)
+            entry = WaitlistEntry(next(self._ids), client, service, master, first_day, last_day, earliest, latest,
+                                  auto_book)
+            self.entries[entry.entry_id] = entry
+            if not self._match_now(entry):
+                self._index(entry)
+        return entry
+
+    def get(self, entry_id):
+        """Заявка по номеру или None"""
+        with self._lock:
+            return self.entries.get(entry_id)
+
+    def remove(self, entry_id):
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None or entry.status in ("booked", "removed"):
+                return False
+            if entry.status == "waiting":
+                self._unindex(entry)
+            entry.status = "removed"
+            return True
+
+    def accept(self, entry_id):
+        """Записывает клиента на предложенное время; если его уже заняли, заявка снова ждет.
+
+        Возвращает (запись или None, сообщение)."""
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None or entry.status != "offered":
+                return None, "Нет предложения по этой заявке"
+            master, day, start = entry.offer
+            appointment, message = self._create(entry, master, day, start)
+            if appointment is None:
+                self.decline(entry_id)
+            return appointment, message
+
+    def decline(self, entry_id):
+        """Возвращает заявку с предложением в лист ожидания"""
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None or entry.status != "offered":
+                return False
+            entry.status, entry.offer = "waiting", None
+            self._index(entry)
+            return True
+
+    def waiting(self):
+        """Заявки, которые еще ждут времени, в порядке подачи"""
+        with self._lock:
+            return [entry for entry in self.entries.values() if entry.status == "waiting"]
+
+    def on_change(self, event, appointment):
+        """Подписчик событий салона: отмененная запись освобождает время ее мастера"""
+        if event != "cancelled":
+            return
+        master, day = appointment.master, appointment.day
+        if day < datetime.now().toordinal():
+            return
+        low = appointment.start
+        high = low + appointment.service.duration + master.break_duration
+        with self._lock:
+            candidates = [
+                entry for name in master.specialization
+                for entry in self.buckets.get((day, name), {}).values()
+                if (entry.master is None or entry.master is master) and entry.earliest < high and entry.latest > low
+            ]
+            candidates.sort(key=lambda entry: entry.entry_id)
+            for entry in candidates:
+                self._try(entry, master, day, low, high)
+
+    def _match_now(self, entry):
+        masters = [entry.master] if entry.master is not None else \
+            list(self.salon.service_masters.get(entry.service.name, {}).values())
+        for day in range(entry.first_day, entry.last_day + 1):
+            for master in masters:
+                if self._try(entry, master, day, 0, DAY_END):
+                    return True
+        return False
+
+    def _try(self, entry, master, day, low, high):
+        """Ищет для заявки время у мастера в этот день, задевающее интервал [low, high); True - заявка удовлетворена"""
+        duration = entry.service.duration
+        not_before = entry.earliest
+        now = datetime.now()
+        if day == now.toordinal():
+            not_before = max(not_before, now.hour * 60 + now.minute)
+        with master.day_lock(day):
+            starts = [start for start in master.iter_free_slots(day, duration, self.step)
+                      if start >= not_before and start + duration > low and start < high
+                      and start + duration <= entry.latest]
+        for start in starts:
+            if not entry.auto_book:
+                self._unindex(entry)
+                entry.status, entry.offer = "offered", (master, day, start)
+                if self.on_offer is not None:
+                    self.on_offer(entry)
+                return True
+            # Время могли занять после подбора - тогда пробуем следующее
+            if self._create(entry, master, day, start)[0] is not None:
+                self._unindex(entry)
+                return True
+        return False
+
+    def _create(self, entry, master, day, start):
+        appointment, message = self.salon.create_appointment(entry.client.client_id, master.master_id,
+                                                             entry.service.service_id, ordinal_to_date(day),
+                                                             minutes_to_time(start))
+        if appointment is not None:
+            entry.status, entry.offer, entry.appointment = "booked", None, appointment
+        return appointment, message
+
+    def _index(self, entry):
+        for day in range(entry.first_day, entry.last_day + 1):
+            self.buckets.setdefault((day, entry.service.name), {})[entry.entry_id] = entry
+
+    def _unindex(self, entry):
+        for day in range(entry.first_day, entry.last_day + 1):
+            bucket = self.buckets.get((day, entry.service.name))
+            if bucket is not None:
+                bucket.pop(entry.entry_id, None)
+                if not bucket:
+                    del self.buckets[(day, entry.service.name)]
+
+    def _prune(self, today):
+        """Убирает корзины прошедших дней; заявки, у которых окно прошло целиком, больше не ждут"""
+        for key in [key for key in self.buckets if key[0] < today]:
+            for entry in self.buckets.pop(key).values():
+                if entry.last_day < today and entry.status == "waiting":
+                    entry.status = "expired"
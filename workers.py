@@ -0,0 +1,79 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TkQueryRunner:
+    """Выполняет запросы к салону в фоновом потоке, а результаты отдает в поток Tk через root.after.
+
+    Запросы объединяются по ключу: новый запрос с тем же ключом отменяет предыдущий,
+    и результат устаревшего запроса в интерфейс уже не попадет.
+    """
+
+    def __init__(self, root, max_workers=1, poll_interval=50):
+        self.root = root
+        self.poll_interval = poll_interval  # как часто (мс) проверять готовые результаты
+        # Один поток по умолчанию: запросы к салону из интерфейса выполняются по очереди
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="salon-query")
+        self.results = queue.Queue()
+        self.generations = {}  # {ключ: номер последнего запроса с этим ключом}
+        self.debounce_jobs = {}  # {ключ: id отложенного вызова root.after}
+        self.closed = False
+        self._poll_job = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, key, func, *args, on_done, on_error=None):
+        """Запускает func(*args) в фоне; on_done(результат) или on_error(исключение) вызываются в потоке Tk"""
+        generation = self.cancel(key)
+        self.executor.submit(self._run, key, generation, func, args, on_done, on_error)
+
+    def cancel(self, key):
+        """Отменяет текущий и отложенный запросы с ключом key, возвращает номер следующего запроса"""
+        job = self.debounce_jobs.pop(key, None)
+        if job is not None:
+            self.root.after_cancel(job)
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        return generation
+
+    def debounce(self, key, delay, callback):
+        """Откладывает callback на delay мс; повторный вызов с тем же ключом сбрасывает ожидание"""
+        job = self.debounce_jobs.pop(key, None)
+        if job is not None:
+            self.root.after_cancel(job)
+        self.debounce_jobs[key] = self.root.after(delay, self._fire_debounced, key, callback)
+
+    def shutdown(self):
+        self.closed = True
+        self.root.after_cancel(self._poll_job)
+        for job in self.debounce_jobs.values():
+            self.root.after_cancel(job)
+        self.debounce_jobs.clear()
+        # Запросы из очереди увидят closed и завершатся сразу
+        self.executor.shutdown(wait=True)
+
+    def _fire_debounced(self, key, callback):
+        self.debounce_jobs.pop(key, None)
+        callback()
+
+    def _is_current(self, key, generation):
+        return not self.closed and self.generations.get(key) == generation
+
+    def _run(self, key, generation, func, args, on_done, on_error):
+        # Запрос мог устареть, пока ждал своей очереди
+        if not self._is_current(key, generation):
+            return
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.results.put((key, generation, on_error, e))
+        else:
+            self.results.put((key, generation, on_done, result))
+
+    def _poll(self):
+        while True:
+            try:
+                key, generation, callback, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if callback is not None and self._is_current(key, generation):
+                callback(value)
+        self._poll_job = self.root.after(self.poll_interval, self._poll)